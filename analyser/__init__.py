@@ -24,4 +24,5 @@ from .analyzer_wrapper import Analyzer
 def Analyser(lang):
     analyser = Analyzer(lang)
     analyser.analyse = analyser.analyze
+    analyser.analyse_many = analyser.analyze_many
     return analyser
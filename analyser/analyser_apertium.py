@@ -8,21 +8,20 @@ from pprint import pprint
 from . import analyzers_config as ac
 from .analyzer_base import BaseAnalyzer
 
+SUPERSCRIPT_PAT = re.compile(r'[¹²]')
+TAG_PAT = re.compile('<[^>]*>')
+
 class ApertiumAnalyser(BaseAnalyzer):
     def __init__(self, lang, analyser_file):
         super().__init__(lang, analyser_file)
+        self.pos_map = ac.analyzer_to_POS_map['apertium']
+        self.tag_map = ac.language_to_tag_map['apertium']
 
     def __map_pos(self, pos):
-        try:
-            return ac.analyzer_to_POS_map['apertium'][pos]
-        except KeyError:
-            return 'Other'
+        return self.pos_map.get(pos, 'Other')
 
     def __map_tag(self, tag):
-        try:
-            return ac.language_to_tag_map['apertium'][tag]
-        except KeyError:
-            return 'UNKNOWN'
+        return self.tag_map.get(tag, 'UNKNOWN')
 
     def __parse(self, an_out):
         readings = (_[0] for _ in an_out)
@@ -36,7 +35,7 @@ class ApertiumAnalyser(BaseAnalyzer):
             for r in rs.split('+'):
                 sep = r.index('<')
                 lemma = self.__delete_superscript(r[:sep])
-                tags = re.findall('<[^>]*>', r[sep:])
+                tags = TAG_PAT.findall(r[sep:])
                 pos = tags[0][1:-1]
                 mpos = self.__map_pos(pos)
                 piece = {
@@ -64,7 +63,7 @@ class ApertiumAnalyser(BaseAnalyzer):
         return an_dict
 
     def __delete_superscript(self, word):
-        word = re.sub(r'[¹²]', '', word)
+        word = SUPERSCRIPT_PAT.sub('', word)
         return word
 
 
@@ -76,3 +75,6 @@ class ApertiumAnalyser(BaseAnalyzer):
         an_dict = self.__parse(an_out)
         an_dict['surface'] = word
         return an_dict
+
+    def _analyze_unique(self, words, first=False, **kwargs):
+        return [self.analyze(w, first) for w in words]
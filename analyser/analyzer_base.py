@@ -7,9 +7,20 @@ from .analyzers_config import *
 from .pre_analyze_config import *
 from .data_to_filter import *
 from .compound_parser import *
+from .profile import LanguageProfile
 
 import rules
 
+
+AT_TAG_PAT = re.compile(r'^@.*@$')
+BASE_TAG_PAT = re.compile(r"@(\w+)+")
+DIGIT_PAT = re.compile(r'\d')
+WORD_PAT = re.compile(r'(?u)\w+')
+SPACE_PAT = re.compile(r'\s')
+
+GOV_CACHE_SIZE = 100000
+
+
 class BaseAnalyzer:
     '''
     A wrapper for different language analysers.
@@ -29,6 +40,7 @@ class BaseAnalyzer:
 
     def __init__(self, lang, analyzer_file):
         self.language = lang
+        self.profile = LanguageProfile(lang)
         self.analyzer = libhfst.HfstInputStream(analyzer_file).read()
 
 
@@ -44,6 +56,33 @@ class BaseAnalyzer:
         return result
 
 
+    def analyze_many(self, words, **kwargs):
+        '''
+        Analyze a list of words. Every distinct word is analyzed once,
+        results are returned in input order and repeated words share
+        the same result object.
+        '''
+        unique = list(dict.fromkeys(words))
+        analyses = dict(zip(unique, self._analyze_unique(unique, **kwargs)))
+        return [analyses[word] for word in words]
+
+
+    def _analyze_unique(self, words, **kwargs):
+        pre_analyzer = self.pre_analyzer
+        post_analyzer = self.post_analyzer
+        pre = [pre_analyzer(word, **kwargs) for word in words]
+        looked_up = self.lookup_many(pre, **kwargs)
+        return [
+            post_analyzer(result, word, **kwargs)
+            for word, result in zip(pre, looked_up)
+        ]
+
+
+    def lookup_many(self, words, **kwargs):
+        lookup = self.lookup
+        return [lookup(word, **kwargs) for word in words]
+
+
     def pre_analyzer(self, word, next_word='', **kwargs):
         """
         A function to preprocess an analyzer's input.
@@ -69,34 +108,52 @@ class BaseAnalyzer:
         result = self.format_sort(result, **kwargs)
         if result['analyses'][self.language] == [{}]:
             result['analyses'][self.language] = []
-        govrules = rules.government_rules.get(self.language, {})
-        analyses = result['analyses'][self.language]
-        exts = []
-        dels = set()
+        govrules = self.profile.gov_rules
         if govrules:
-            for i, analysis in enumerate(analyses):
+            analyses = result['analyses'][self.language]
+            kept = []
+            exts = []
+            for analysis in analyses:
                 a = analysis[0]
-                (lemma, pos) = (a['base'], a['pos'])
-                key = (lemma, pos)
-                if key in govrules:
-                    dels.add(i)
-                    cases = govrules[key]
-                    ext = []
-                    for case in cases:
-                        e = copy.deepcopy(a)
-                        e['tags']['GOV_CASE'] = case
-                        ext.append([e])
-                    exts.extend(ext)
-            analyses = [
-                a
-                for i, a in enumerate(analyses)
-                if i not in dels
-            ]
-            analyses.extend(exts)
-            result['analyses'][self.language] = analyses
+                cases = govrules.get((a['base'], a['pos']))
+                if cases is not None:
+                    exts.extend(self._government_variants(a, cases))
+                else:
+                    kept.append(analysis)
+            kept.extend(exts)
+            result['analyses'][self.language] = kept
         return result
 
 
+    def _government_variants(self, a, cases):
+        """
+        Readings of `a` with GOV_CASE set to each governed case. They
+        are built once per distinct reading and shared afterwards, so
+        they must not be modified.
+        """
+        try:
+            key = (
+                tuple((k, v) for k, v in a.items() if k != 'tags'),
+                tuple(a['tags'].items())
+            )
+            return self.profile.gov_variants[key]
+        except TypeError:
+            # Unhashable tag values, build without caching
+            key = None
+        except KeyError:
+            pass
+        variants = tuple(
+            [{**a, 'tags': {**a['tags'], 'GOV_CASE': case}}]
+            for case in cases
+        )
+        if key is not None:
+            cache = self.profile.gov_variants
+            if len(cache) >= GOV_CACHE_SIZE:
+                cache.clear()
+            cache[key] = variants
+        return variants
+
+
     def format_sort_old(self, result, **kwargs):
         '''Sort the analyses by fragment count'''
         sorted_result = []
@@ -128,10 +185,7 @@ class BaseAnalyzer:
         A function which decides depending on language whether to keep word case as it was
         in an input or to change it.
         """
-        if schema == 'surface':
-            capitalization_schema = language_to_capitalization_map[self.language]
-        else:
-            capitalization_schema = base_capitalization_map[self.language]
+        capitalization_schema = self.profile.capitalization(schema)
         if capitalization_schema == 'default':
             return token
         elif capitalization_schema == 'lower':
@@ -148,10 +202,10 @@ class BaseAnalyzer:
         A function to map one characters to others before analyses.
         """
         if word != None:
-            ch_map = characters_map.get(self.language, None)
+            ch_map = self.profile.char_map
             if ch_map != None:
-                for k in list(ch_map.keys()):
-                    word = word.replace(k, ch_map[k])
+                for k, v in ch_map:
+                    word = word.replace(k, v)
             return word
         else:
             return None
@@ -168,16 +222,14 @@ class BaseAnalyzer:
         Args:
           analyses: lololkek 
         """
-        pattern = re.compile(r'^@.*@$')
-                    
-        output_format = output_format_map.get(self.language, None)
-        if output_format == 'default':
+        if self.profile.output_format == 'default':
             result = []
             if len(analyses) > 0:
+                match = AT_TAG_PAT.match
                 for analysis in analyses:
                     analysis_string = ''
                     for element in analysis[1]:
-                        if not pattern.match(element):
+                        if not match(element):
                             analysis_string += element
                     result.append(analysis_string)
             else:
@@ -188,8 +240,7 @@ class BaseAnalyzer:
 
 
     def parse_analysis(self, analyses):
-        analyzer_type = language_to_analyzer_type.get(self.language, language_to_analyzer_type['DEFAULT'])
-        pos_map = analyzer_to_POS_map[analyzer_type]
+        pos_map = self.profile.pos_map
         result = []
         analyses_input = []
         if len(analyses) > 0:
@@ -228,13 +279,14 @@ class BaseAnalyzer:
     def parse_compound(self, potential_compound):
         """
         The CompoundParser class has language specific compound parsing
-        methods. Edit that accordingly.
+        methods. Edit that accordingly. Results are memoized per raw
+        analysis string and shared, do not modify them.
         """
-        return CompoundParser(self.language).parse_compound(potential_compound)
+        return self.profile.parse_compound(potential_compound)
         
 
     def process_base(self, base):
-        s = re.findall(r"@(\w+)+", base) # clean base forms from gram. tags from Finnish bases
+        s = BASE_TAG_PAT.findall(base) # clean base forms from gram. tags from Finnish bases
         if len(s) != 0:
             return max(s, key=len)
         else:
@@ -271,7 +323,7 @@ class BaseAnalyzer:
 
     
     def modify_tags(self, tags):
-        tag_map = language_to_tag_map.get(self.language, language_to_tag_map['DEFAULT'])
+        tag_map = self.profile.tag_map
         ##- print('*** TAG MAP: %s' % tag_map)
         new_tags = dict()
         if tags != None:
@@ -286,12 +338,12 @@ class BaseAnalyzer:
         new_token_dicts = []
         whitespace_flag = False
         for analysis in token_dict:
-            if re.match(r'\d', token):
+            if DIGIT_PAT.match(token):
                 analysis = {}
                 analysis['pos'] = 'number'
-            if not re.match(r'(?u)\w+', token):
+            if not WORD_PAT.match(token):
                 analysis = {}
-                if re.match(r'\s', token):
+                if SPACE_PAT.match(token):
                     analysis['pos'] = 'whitespace'
                     whitespace_flag = True
                 else:
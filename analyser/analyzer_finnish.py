@@ -18,12 +18,24 @@ analyser_file = os.path.join(
 generator_file = os.path.join(
     PREFIX, 'fin/src/generator-gt-desc.hfstol')
 
+# Remove all Use (except Rare, sub, Arch) and Sem tags
+USE_SEM_PAT = re.compile(r'\+(Use/(?!(Rare|sub|Arch))|Sem/)[a-zA-z]*')
+DECIMAL_PAT = re.compile(r'\d+\.\d+')
+FI_TAG_MAP = language_to_tag_map.get(
+    'Finnish', language_to_tag_map['DEFAULT'])
+GIELLA_POS_MAP = analyzer_to_POS_map['giella']
+
 
 class FinnishAnalyzer(BaseAnalyzer):
     def __init__(self, lang, analyzer_file):
         super().__init__(lang, analyzer_file)
 
     def lookup(self, word, **kwargs):
+        '''
+        Compounds are split by CompoundAnalysis, not by the shared
+        CompoundParser: WordAnalyses.cleanup() modifies the parsed
+        analyses, so they cannot be memoized and shared between words.
+        '''
         lookstr = word.lower() if word in lowercase else word
         if lookstr.lower() in fixed_analyses:
             ps = fixed_analyses[lookstr.lower()]
@@ -45,8 +57,7 @@ generator = None
 
 def str_cleanup(s):
     # Remove all Use (except Rare, sub, Arch) and Sem tags
-    pattern = r'\+(Use/(?!(Rare|sub|Arch))|Sem/)[a-zA-z]*'
-    s = re.sub(re.compile(pattern), '', s)
+    s = USE_SEM_PAT.sub('', s)
     # Replace +Pass with +Pss, since they are equivalent
     s = s.replace('+Pass', '+Pss')
     # Same with +Propn and +Prop
@@ -276,8 +287,7 @@ class WordAnalyses:
         return string
 
     def modify_tags(self, tags):
-        tag_map = language_to_tag_map.get(
-            'Finnish', language_to_tag_map['DEFAULT'])
+        tag_map = FI_TAG_MAP
         ##- print('*** TAG MAP: %s' % tag_map)
         new_tags = dict()
         if tags != None:
@@ -305,7 +315,7 @@ class WordAnalyses:
                 dct = {}
                 dct['base'] = el.lemma
                 sp = analysis.analysis_list[-1]
-                dct['pos'] = analyzer_to_POS_map['giella'].get(
+                dct['pos'] = GIELLA_POS_MAP.get(
                     sp.pos, sp.pos
                 )
                 dct['tags'] = self.modify_tags(el.tags)
@@ -652,7 +662,7 @@ class WordAnalyses:
     def __fix_digits(self):
         # removing error tags from analyses of digits like 10.5
         err_tag = 'Err/Orth'
-        if re.match(r'\d+\.\d+', self.surface):
+        if DECIMAL_PAT.match(self.surface):
             for p in self.analyses:
                 for e in p.analysis_list:
                     if (e.pos == 'Num' and
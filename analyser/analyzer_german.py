@@ -2,13 +2,16 @@ import libhfst
 from pprint import pprint
 import re
 from .analyzer_base import BaseAnalyzer
+from .profile import LanguageProfile
 BLACKLISTED_FIRSTS = ['E', 'Es']
+TRUNC_SUFFIX_PAT = re.compile(r"<->[a-z]*")
 
 class GermanAnalyzer(BaseAnalyzer):
 
     
     def __init__(self, lang, analyzer_file, **kwargs):
         self.language = lang
+        self.profile = LanguageProfile(lang)
         self.analyzer = libhfst.HfstInputStream(analyzer_file).read()
         #self.__init_analyzer(analyzer_file)        
 
@@ -64,7 +67,7 @@ class GermanAnalyzer(BaseAnalyzer):
         a = a.replace('-<TRUNC>', '#')
         a = a.replace('{', '')
         a = a.replace('{', '')
-        a = re.sub(r"<->[a-z]*", "", a)
+        a = TRUNC_SUFFIX_PAT.sub("", a)
         return a
 
 
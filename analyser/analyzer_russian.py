@@ -4,6 +4,7 @@ import os, sys, re, string, copy
 import itertools
 from . import AnalysisError
 from .analyzer_base import BaseAnalyzer
+from .profile import LanguageProfile
 from .analyzers_config import *
 # Already applied in analyser_base
 # from .character_map import characters_map
@@ -65,6 +66,45 @@ bad_tags = (
     # 'Predic'
 )
 
+CROSSLATOR_POS_MAP = analyzer_to_POS_map['crosslator']
+
+# Crosslator tag values -> our tag values
+CASE_MAP = {
+    '0': '0',
+    'i': 'Nom',
+    'r': 'Gen',
+    'v': 'Acc',
+    'd': 'Dat',
+    't': 'Ins',
+    'p': 'Loc'
+}
+
+COMP_MAP = {
+    '0': '0',
+    'com': 'Comp',
+    'pos': 'Positive',
+    'sup': 'Super'
+}
+
+FORM_MAP = {'y': 'short', 'n': 'full'}
+
+VERB_MAP = {
+    '0': '0',
+    'sov': 'Perf',
+    'nesov': 'Imperf',
+    'imp': 'Imprt',
+    'ind': 'Ind',
+    'past': 'Past',
+    'pres': 'Pres',
+    'fut': 'Fut',
+    'tr': 'Trans',
+    'intr': 'Intrans',
+    'a': 'Act',
+    'p': 'Pass',
+    'n': 'Non-infinit',
+    'y': 'Infinit'
+}
+
 # Not used as of 2018-09-26
 pos_list = [
     'Noun',
@@ -82,6 +122,77 @@ pos_list = [
     'Punct'
 ]
 
+morph = None
+
+def get_morph():
+    '''
+    Process-wide pymorphy2 analyser, created on first use.
+    '''
+    global morph
+    if morph is None:
+        morph = pymorphy2.MorphAnalyzer()
+    return morph
+
+
+PARTICIPLE_CACHE_SIZE = 100000
+
+
+def _not_stored(surface):
+    raise KeyError(surface)
+
+
+class ParticipleLemmas:
+    '''
+    Memoized surface -> participle lemma table (masculine singular
+    nominative form generated by pymorphy2). None means that pymorphy2
+    has no participle reading for the surface.
+
+    Misses go to `lookup`, a function raising KeyError for unknown
+    surfaces (e.g. AnalysisStore.participle), before pymorphy2. Entries
+    added since the last take_new() are kept apart so that only they
+    need to be stored. The memo is cleared when it grows past
+    PARTICIPLE_CACHE_SIZE.
+    '''
+    def __init__(self):
+        self.lemmas = {}
+        self.new = {}
+        self.lookup = _not_stored
+
+    def _parse(self, surface, morph):
+        ps = morph.parse(surface)
+        chosen_p = [p for p in ps if p.tag.POS in ['PRTF', 'PRTS']]
+        if not chosen_p:
+            return None
+        inflected = chosen_p[0].inflect({'nomn', 'sing', 'masc'})
+        return inflected.word
+
+    def get(self, surface, morph):
+        try:
+            return self.lemmas[surface]
+        except KeyError:
+            pass
+        if surface in self.new:
+            lemma = self.new[surface]
+        else:
+            try:
+                lemma = self.lookup(surface)
+            except KeyError:
+                lemma = self._parse(surface, morph)
+                self.new[surface] = lemma
+        if len(self.lemmas) >= PARTICIPLE_CACHE_SIZE:
+            self.lemmas.clear()
+        self.lemmas[surface] = lemma
+        return lemma
+
+    def take_new(self):
+        new = self.new
+        self.new = {}
+        return new
+
+
+participle_lemmas = ParticipleLemmas()
+
+
 class SingleParsing:
     def __init__(self, word_str):
         tokens = word_str.split(';')
@@ -126,7 +237,7 @@ class SingleParsing:
         return self.tags + [self.pos]
 
     def modify_pos(self):
-        pos_map = analyzer_to_POS_map['crosslator']
+        pos_map = CROSSLATOR_POS_MAP
         pos = pos_map.get(self.pos, self.pos)
         self.pos = pos
 
@@ -141,44 +252,14 @@ class SingleParsing:
                 if tag[0] in ['animate', 'gender', 'number', 'person']:
                     value = tag[1].capitalize()
                 if tag[0] == 'case':
-                    case_map = {
-                        '0': '0',
-                        'i': 'Nom',
-                        'r': 'Gen',
-                        'v': 'Acc',
-                        'd': 'Dat',
-                        't': 'Ins',
-                        'p': 'Loc'
-                    }
-                    value = case_map.get(tag[1], '0')
+                    value = CASE_MAP.get(tag[1], '0')
                 if tag[0] == 'comp':
-                    comp_map = {'0': '0',
-                                'com': 'Comp',
-                                'pos': 'Positive',
-                                'sup': 'Super'}
-                    value = comp_map.get(tag[1], '0')
+                    value = COMP_MAP.get(tag[1], '0')
                     kay = 'COMPAR'
                 if tag[0] == 'short':
-                    form_map = {'y': 'short', 'n': 'full'}
-                    value = form_map.get(tag[1], '0')
+                    value = FORM_MAP.get(tag[1], '0')
                 if tag[0] in ['aspect', 'mood', 'tense', 'transit', 'voice', 'inf']:
-                    verb_map = {
-                        '0': '0',
-                        'sov': 'Perf',
-                        'nesov': 'Imperf',
-                        'imp': 'Imprt',
-                        'ind': 'Ind',
-                        'past': 'Past',
-                        'pres': 'Pres',
-                        'fut': 'Fut',
-                        'tr': 'Trans',
-                        'intr': 'Intrans',
-                        'a': 'Act',
-                        'p': 'Pass',
-                        'n': 'Non-infinit',
-                        'y': 'Infinit'
-                    }
-                    value = verb_map.get(tag[1], '0')
+                    value = VERB_MAP.get(tag[1], '0')
                 if len(key) != 0:
                     new_tags[key] = value
         self.tags = new_tags
@@ -387,14 +468,10 @@ class WordParsings:
         new_parsings = []
         for parsing in self.parsings:
             if parsing.pos == 'Participle':
-                ps = self.morph.parse(self.surface)
-                chosen_p = [p for p in ps if p.tag.POS in ['PRTF', 'PRTS']]
-                if not chosen_p:
+                lemma = participle_lemmas.get(self.surface, self.morph)
+                if lemma is None:
                     return None
                 else:
-                    chosen_p = chosen_p[0]
-                    inflected = chosen_p.inflect({'nomn', 'sing', 'masc'})
-                    lemma = inflected.word
                     # for key, value in char_map.items():
                     #     if key in lemma:
                     #         lemma = lemma.replace(key, value)
@@ -532,9 +609,17 @@ class WordParsings:
 class RussianAnalyzer(BaseAnalyzer):
     def __init__(self, lang, analyzer_file):
         self.language = lang
+        self.profile = LanguageProfile(lang)
         self.analyser = Analyzer()
         self.analyser.loadVocabulary(analyzer_file)
-        self.morph = pymorphy2.MorphAnalyzer()
+        self.morph = get_morph()
+        self.participles = participle_lemmas
+
+    def set_participle_lookup(self, lookup):
+        self.participles.lookup = lookup
+
+    def new_participles(self):
+        return self.participles.take_new()
 
         
     def lookup(self, word, next_word=None, **kwargs):
@@ -1,9 +1,40 @@
 import re
+from functools import lru_cache
+
+STEM_PAT = re.compile(r'\w+(?:<\+*\w*\/*\w+>)*')
+BASE_PART_PAT = re.compile(r'(\w+)<')
+TAG_DATA_PAT = re.compile(r'<(\+*\w+)>')
+
 
 class CompoundParser():
-    def __init__(self, lang):
+    '''
+    Compound parsing strategy for a language. The same raw analysis
+    strings come up again and again in a corpus, so results are kept in
+    a bounded table keyed by the raw string. Cached results are shared,
+    callers must not modify them.
+
+    Use CompoundParser.for_language() to get the process-wide instance.
+    '''
+    _parsers = {}
+
+    def __init__(self, lang, cache_size=2**17):
         self.lang = lang
-        self.parse_compound = MAP_LANGUAGE_TO_COMPOUND_PARSER[lang]
+        self.function = MAP_LANGUAGE_TO_COMPOUND_PARSER.get(lang)
+        if self.function is None:
+            self.parse_compound = None
+        else:
+            self.parse_compound = lru_cache(maxsize=cache_size)(self.function)
+
+    @classmethod
+    def for_language(cls, lang):
+        if lang not in cls._parsers:
+            cls._parsers[lang] = cls(lang)
+        return cls._parsers[lang]
+
+    def cache_info(self):
+        if self.parse_compound is None:
+            return None
+        return self.parse_compound.cache_info()
 
 
 def parse_compound_finnish(potential_compound):
@@ -42,17 +73,17 @@ def parse_compound_swedish(potential_compound):
     is_compound = False
     potential_compound = potential_compound.replace('<CAP>', '')
     potential_compound = potential_compound.replace('<SUFF>', '')
-    stems_analysis = re.findall(r'\w+(?:<\+*\w*\/*\w+>)*', potential_compound)
+    stems_analysis = STEM_PAT.findall(potential_compound)
     #print('STEMS ANALYSIS: %s' % stems_analysis)
     if len(stems_analysis) > 1:
         is_compound = True
     for stem_analysis in stems_analysis:
         morph_data = []
-        base_part = re.findall(r'(\w+)<', stem_analysis)
+        base_part = BASE_PART_PAT.findall(stem_analysis)
         if len(base_part) == 0:
             base_part.append(stem_analysis) 
         #print('Base part: {0}'.format(base_part))
-        tags_data = re.findall(r'<(\+*\w+)>', stem_analysis)
+        tags_data = TAG_DATA_PAT.findall(stem_analysis)
         #print('TAGS DATA: %s' % tags_data)
         if len(base_part) != 0:
             morph_data.append(base_part[0]) 
@@ -66,18 +97,18 @@ def parse_compound_kazakh(potential_compound):
     #print ("*** INPUT POTENTIAL_COMPOUND %s" %potential_compound)
     all_morph_data = []
     is_compound = False
-    stems_analysis = re.findall(r'\w+(?:<\+*\w*\/*\w+>)*', potential_compound)
+    stems_analysis = STEM_PAT.findall(potential_compound)
     #print('STEMS ANALYSIS: %s' % stems_analysis)
     ### TEMPORARY HACK: we do not take bases except for the first one returned by an analyzer
     stems_analysis = [stems_analysis[0]]
     #print('STEMS ANALYSIS 0: %s' % stems_analysis[0])
     for stem_analysis in stems_analysis:
         morph_data = []
-        base_part = re.findall(r'(\w+)<', stem_analysis)
+        base_part = BASE_PART_PAT.findall(stem_analysis)
         if len(base_part) == 0:
             base_part.append(stem_analysis) 
         #print('Base part: {0}'.format(base_part))
-        tags_data = re.findall(r'<(\+*\w+)>', stem_analysis)
+        tags_data = TAG_DATA_PAT.findall(stem_analysis)
         #print('TAGS DATA: %s' % tags_data)
         if len(base_part) != 0:
             morph_data.append(base_part[0]) 
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+'''
+Per-language settings of an analyser, resolved once.
+
+The analysers used to look up the analyser type, POS and tag maps,
+capitalization schemas and the compound parser in the config
+dictionaries for every word. A LanguageProfile is built when the
+analyser is constructed and the per-word code reads from it instead.
+'''
+
+from .analyzers_config import *
+from .pre_analyze_config import *
+from .compound_parser import CompoundParser
+
+import rules
+
+
+class LanguageProfile:
+    def __init__(self, lang):
+        self.language = lang
+        self.analyzer_type = language_to_analyzer_type.get(
+            lang, language_to_analyzer_type['DEFAULT'])
+        self.pos_map = analyzer_to_POS_map[self.analyzer_type]
+        self.tag_map = language_to_tag_map.get(
+            lang, language_to_tag_map['DEFAULT'])
+        self.output_format = output_format_map.get(lang, None)
+        self.surface_capitalization = language_to_capitalization_map.get(lang)
+        self.base_capitalization = base_capitalization_map.get(lang)
+        ch_map = characters_map.get(lang, None)
+        self.char_map = list(ch_map.items()) if ch_map is not None else None
+        self.compound_parser = CompoundParser.for_language(lang)
+        self.parse_compound = self.compound_parser.parse_compound
+        self.gov_rules = {
+            key: tuple(cases)
+            for key, cases in rules.government_rules.get(lang, {}).items()
+        }
+        # Government-case variants of readings, see
+        # BaseAnalyzer._government_variants
+        self.gov_variants = {}
+
+    def capitalization(self, schema):
+        if schema == 'surface':
+            return self.surface_capitalization
+        else:
+            return self.base_capitalization
+
+    def __str__(self):
+        return str(self.__dict__)
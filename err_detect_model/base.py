@@ -1,51 +1,40 @@
 # -*- coding: utf-8 -*
 
-import os
 import tensorflow as tf
 from tensorflow.contrib.rnn import GRUCell
 from tensorflow.contrib.rnn import LSTMCell
 from tensorflow.python.ops.rnn import bidirectional_dynamic_rnn as bi_rnn
+from tensorflow.contrib.cudnn_rnn import CudnnCompatibleLSTMCell
+from tensorflow.contrib.rnn import LSTMBlockFusedCell
+from tensorflow.contrib.rnn import stack_bidirectional_dynamic_rnn
+from tensorflow.python.client import device_lib
 from .attention import attention
+from .input_pipeline import InputPipeline
 
 
-class BaseModel:
-    def _parse(self, example):
-        features = {
-            'sent': tf.FixedLenFeature(
-                shape=[self.winsize],
-                dtype=tf.int64
-            ),
-            'label': tf.FixedLenFeature(
-                shape=[1],
-                dtype=tf.int64
-            )
-        }
-        parsed = tf.parse_single_example(example, features)
-        return parsed
+# Recurrent layer implementations, see BaseModel.build_bilstm:
+# cudnn: CudnnLSTM, GPU only
+# cpu: CudnnCompatibleLSTMCell, one op per time step
+# fused: LSTMBlockFusedCell, one op per direction
+# auto: cudnn if there is a GPU, fused otherwise
+RNN_BACKENDS = ['auto', 'cudnn', 'cpu', 'fused']
+
 
+def gpu_available():
+    return any(
+        d.device_type == 'GPU'
+        for d in device_lib.list_local_devices()
+    )
 
+
+class BaseModel:
     def read_instances(self):
         self.train_file = tf.placeholder(tf.string, shape=[])
-        train_data = tf.data.TFRecordDataset(self.train_file)
-        train_data = train_data.shuffle(10000)
-        train_data = train_data.repeat(self.epochs)
-        train_data = train_data.map(
-            self._parse,
-            num_parallel_calls=os.cpu_count() // 2
-        )
-        train_data = train_data.batch(self.bsize)
-        train_data = train_data.prefetch(1)
+        train_data = self.input_pipeline.train_dataset(self.train_file)
         self.train_it = train_data.make_initializable_iterator()
 
         self.valid_file = tf.placeholder(tf.string, shape=[])
-        valid_data = tf.data.TFRecordDataset(self.valid_file)
-        valid_data = valid_data.shuffle(10000)
-        valid_data = valid_data.map(
-            self._parse,
-            num_parallel_calls=os.cpu_count() // 2
-        )
-        valid_data = valid_data.batch(self.bsize)
-        valid_data = valid_data.prefetch(1)
+        valid_data = self.input_pipeline.eval_dataset(self.valid_file)
         self.valid_it = valid_data.make_initializable_iterator()
 
 
@@ -65,15 +54,72 @@ class BaseModel:
 #             attention_output, alphas = attention(rnn_outputs, self.attention_size, return_alphas=True)
 #             tf.summary.histogram('alphas', alphas)
 #         drop = tf.nn.dropout(attention_output, self.dropout)
-        bilstm = tf.contrib.cudnn_rnn.CudnnLSTM(
-            1,
-            self.lstm_hidden_size,
-            direction='bidirectional',
-            dropout=self.dropout
-        )
-        return bilstm(embed)[0]
+        backend = self.rnn_backend
+        if backend == 'auto':
+            backend = 'cudnn' if gpu_available() else 'fused'
+        if backend == 'cudnn':
+            bilstm = tf.contrib.cudnn_rnn.CudnnLSTM(
+                self.lstm_layers,
+                self.lstm_hidden_size,
+                direction='bidirectional',
+                dropout=self.dropout
+            )
+            return bilstm(embed)[0]
+        # CudnnLSTM saves its weights in canonical form under these
+        # scopes, so the CPU versions below load the same checkpoints.
+        # Like CudnnLSTM they take the input as time major.
+        with tf.variable_scope('cudnn_lstm'):
+            if backend == 'cpu':
+                return self._compatible_bilstm(embed)
+            elif backend == 'fused':
+                return self._fused_bilstm(embed)
+        raise ValueError(f'Unknown RNN backend {backend}')
         #return drop
 
+    def _compatible_bilstm(self, embed):
+        cells_fw = [
+            CudnnCompatibleLSTMCell(self.lstm_hidden_size)
+            for _ in range(self.lstm_layers)
+        ]
+        cells_bw = [
+            CudnnCompatibleLSTMCell(self.lstm_hidden_size)
+            for _ in range(self.lstm_layers)
+        ]
+        outputs, _, _ = stack_bidirectional_dynamic_rnn(
+            cells_fw,
+            cells_bw,
+            embed,
+            dtype=tf.float32,
+            time_major=True
+        )
+        return outputs
+
+    def _fused_bilstm(self, embed):
+        '''
+        Same network as _compatible_bilstm with LSTMBlockFusedCell, which
+        runs a whole direction in one op. The cells are named and scoped
+        like the CudnnCompatibleLSTMCell ones and use the same kernel
+        and bias layout, so the variables are interchangeable.
+        '''
+        outputs = embed
+        with tf.variable_scope('stack_bidirectional_rnn'):
+            for i in range(self.lstm_layers):
+                scope = f'cell_{i}/bidirectional_rnn'
+                with tf.variable_scope(f'{scope}/fw'):
+                    fw, _ = LSTMBlockFusedCell(
+                        self.lstm_hidden_size,
+                        forget_bias=0.0,
+                        name='cudnn_compatible_lstm_cell'
+                    )(outputs, dtype=tf.float32)
+                with tf.variable_scope(f'{scope}/bw'):
+                    bw, _ = LSTMBlockFusedCell(
+                        self.lstm_hidden_size,
+                        forget_bias=0.0,
+                        name='cudnn_compatible_lstm_cell'
+                    )(tf.reverse(outputs, axis=[0]), dtype=tf.float32)
+                outputs = tf.concat([fw, tf.reverse(bw, axis=[0])], axis=-1)
+        return outputs
+
     def build_mlp(self, context):
         # Flatten BiLSTM outputs for every word (21)
         flat_context = tf.contrib.layers.flatten(context)
@@ -111,12 +157,21 @@ class BaseModel:
             initializer=tf.contrib.layers.xavier_initializer(),
             trainable=True
         )
-        # Placeholder to plug in pretrained embeddings
+        # Plugs in pretrained embeddings a block of rows at a time, so
+        # the matrix is never fed or held in memory as a whole
         self.pretrain_ph = tf.placeholder(
             tf.float32,
-            shape=[self.vin, self.embed_dim]
+            shape=[None, self.embed_dim]
+        )
+        self.pretrain_offset = tf.placeholder(tf.int32, shape=[])
+        self.set_pretrain = tf.scatter_update(
+            in_W,
+            tf.range(
+                self.pretrain_offset,
+                self.pretrain_offset + tf.shape(self.pretrain_ph)[0]
+            ),
+            self.pretrain_ph
         )
-        self.set_pretrain = tf.assign(in_W, self.pretrain_ph)
         with tf.name_scope('get-embeddings'):
             embeddings = self.get_embeddings(instances, in_W)
 
@@ -148,7 +203,10 @@ class BaseModel:
             embed_dim,
             hidden_size,
             attention_size,
-            dropout
+            dropout,
+            input_pipeline=None,
+            rnn_backend='cudnn',
+            lstm_layers=1
     ):
         self.global_step = tf.get_variable(
             'global-step',
@@ -166,3 +224,8 @@ class BaseModel:
         self.attention_size = attention_size
         self.mlp_hidden_size = 2 * hidden_size
         self.dropout = dropout
+        self.rnn_backend = rnn_backend
+        self.lstm_layers = lstm_layers
+        if input_pipeline is None:
+            input_pipeline = InputPipeline(winsize, bsize, epochs)
+        self.input_pipeline = input_pipeline
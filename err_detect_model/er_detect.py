@@ -22,6 +22,8 @@ class ErDetectModel(BaseModel):
             'network',
             self.network_template
         )
+        # Reused by callers that feed the network from other inputs
+        self.run_network = run_network
 
         train_logits = run_network(train_sents)
         valid_logits = run_network(valid_sents)
@@ -101,7 +103,9 @@ class ErDetectModel(BaseModel):
         attention_size,
         l2_lambda,
         dropout,
-
+        input_pipeline=None,
+        rnn_backend='cudnn',
+        lstm_layers=1
     ):
         super().__init__(
             vin,
@@ -112,6 +116,9 @@ class ErDetectModel(BaseModel):
             hidden_size,
             attention_size,
             dropout,
+            input_pipeline,
+            rnn_backend,
+            lstm_layers
         )
         self.l2_lambda = l2_lambda
 
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*
+'''
+Frozen inference graphs.
+
+export_model() rebuilds only the network (embedding lookup, BiLSTM,
+MLP, sigmoid) on an int64 [None, winsize] placeholder, restores its
+weights from a training checkpoint, turns the variables into constants
+and runs the graph transforms that strip and fold what inference does
+not need. The result is a single GraphDef, model.pb, with meta.json
+next to it.
+
+A model trained on a pruned vocabulary (scripts/prune_vocab.py) gets
+its remap table baked in: the graph maps full-vocabulary IDs to pruned
+ones before the lookup, so callers feed the same IDs as to any other
+export.
+
+With `quantize` the input weights are stored as a float16 or int8
+table (see utils.quantize) and only the rows looked up are converted
+back to float32. int8 additionally stores the LSTM and MLP weights in
+eight bits (the quantize_weights transform); they are dequantised when
+the graph runs, TensorFlow has no int8 kernels for these ops on CPU.
+
+FrozenModel loads it without the training graph, the input pipeline or
+the optimizer state, and is callable on windows of surface IDs.
+'''
+
+import os
+import json
+import time
+import functools
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+from utils import quantize as quant
+from .base import BaseModel
+
+INPUT = 'windows'
+OUTPUT = 'probs'
+GRAPH_FILE = 'model.pb'
+META_FILE = 'meta.json'
+# Protocol buffers cannot be serialised beyond 2GB
+MAX_GRAPH_BYTES = 2**31 - 1
+TRANSFORMS = [
+    'strip_unused_nodes(type=int64)',
+    'remove_nodes(op=Identity, op=CheckNumerics)',
+    'fold_constants(ignore_errors=true)',
+    'fold_old_batch_norms',
+    'sort_by_execution_order'
+]
+QUANTIZE_TRANSFORMS = [
+    'quantize_weights(minimum_size=1024)',
+    'strip_unused_nodes(type=int64)',
+    'sort_by_execution_order'
+]
+EMBEDDINGS = 'network/input-weights'
+
+
+def quantized_lookup(table, scale, instances):
+    '''
+    Rows `instances` of a utils.quantize table as float32.
+    '''
+    rows = tf.cast(tf.gather(tf.constant(table), instances), tf.float32)
+    if scale is not None:
+        scale = tf.cast(tf.gather(tf.constant(scale), instances), tf.float32)
+        rows *= tf.expand_dims(scale, -1)
+    return rows
+
+
+class QuantizedModel(BaseModel):
+    '''
+    BaseModel looking its inputs up in a quantised table. The
+    input-weights variable is still created and restored, but nothing
+    uses it, so it is not frozen.
+    '''
+    def __init__(self, table, scale, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.table = table
+        self.scale = scale
+
+    def get_embeddings(self, instances, in_W):
+        return quantized_lookup(self.table, self.scale, instances)
+
+
+def export_model(
+        checkpoint,
+        out_dir,
+        vin,
+        winsize,
+        embed_dim,
+        hidden_size,
+        lstm_layers=1,
+        rnn_backend='fused',
+        quantize='none',
+        remap=None
+):
+    '''
+    Freeze the network of `checkpoint` into `out_dir`. The CPU
+    backends load CudnnLSTM weights, see BaseModel.build_bilstm.
+    `remap` is the old -> new ID array the checkpoint was trained with,
+    if any.
+    '''
+    graph = tf.Graph()
+    with graph.as_default():
+        if quantize == 'none':
+            model_class = BaseModel
+        else:
+            table, scale = quant.quantize_rows(
+                tf.train.load_variable(checkpoint, EMBEDDINGS),
+                quantize
+            )
+            model_class = functools.partial(QuantizedModel, table, scale)
+        model = model_class(
+            vin,
+            1,
+            1,
+            winsize,
+            embed_dim,
+            hidden_size,
+            0,
+            0.0,
+            rnn_backend=rnn_backend,
+            lstm_layers=lstm_layers
+        )
+        windows = tf.placeholder(tf.int64, shape=[None, winsize], name=INPUT)
+        ids = windows
+        if remap is not None:
+            ids = tf.gather(tf.constant(remap, dtype=tf.int64), windows)
+        network = tf.make_template('network', model.network_template)
+        logits = network(ids)
+        tf.identity(tf.nn.sigmoid(logits)[:, 0], name=OUTPUT)
+        saver = tf.train.Saver(
+            tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope='network')
+        )
+        with tf.Session(config=tf.ConfigProto(device_count={'GPU': 0})) as sess:
+            saver.restore(sess, checkpoint)
+            frozen = tf.graph_util.convert_variables_to_constants(
+                sess,
+                graph.as_graph_def(),
+                [OUTPUT]
+            )
+    frozen = TransformGraph(frozen, [INPUT], [OUTPUT], TRANSFORMS)
+    if quantize == 'int8':
+        frozen = TransformGraph(frozen, [INPUT], [OUTPUT], QUANTIZE_TRANSFORMS)
+    if frozen.ByteSize() > MAX_GRAPH_BYTES:
+        raise ValueError(
+            f'Frozen graph is {frozen.ByteSize() / 2**30:.1f}GB, over the 2GB'
+            ' protobuf limit; prune the input vocabulary first'
+        )
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, GRAPH_FILE), 'wb') as f:
+        f.write(frozen.SerializeToString())
+    meta = {
+        'checkpoint': checkpoint,
+        'input': INPUT,
+        'output': OUTPUT,
+        'winsize': winsize,
+        'vocab_size': vin if remap is None else len(remap),
+        'remapped': remap is not None,
+        'rnn_backend': rnn_backend,
+        'quantize': quantize,
+        'threshold': 0.5
+    }
+    with open(os.path.join(out_dir, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class FrozenModel:
+    '''
+    A graph written by export_model(), loaded on the CPU. Calling it on
+    a [n, winsize] array of windows returns their probabilities. The
+    LSTM runs along the batch axis (see BaseModel.build_bilstm), so the
+    scores depend on the whole batch: do not pad or coalesce batches,
+    i.e. do not use it with batching.BatchScheduler. `threads` sets the
+    intra-op parallelism, 0 leaves it to TensorFlow.
+    '''
+    def __init__(self, export_dir, threads=0):
+        start = time.perf_counter()
+        with open(os.path.join(export_dir, META_FILE), 'r') as f:
+            self.meta = json.load(f)
+        if self.meta['rnn_backend'] == 'fused':
+            # Registers the BlockLSTM op
+            import tensorflow.contrib.rnn  # noqa: F401
+        graph_def = tf.GraphDef()
+        with open(os.path.join(export_dir, GRAPH_FILE), 'rb') as f:
+            graph_def.ParseFromString(f.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        del graph_def
+        self.windows = self.graph.get_tensor_by_name(self.meta['input'] + ':0')
+        self.probs = self.graph.get_tensor_by_name(self.meta['output'] + ':0')
+        # Set by the calibration in scripts/eval_quantized.py
+        self.threshold = self.meta.get('threshold', 0.5)
+        config = tf.ConfigProto(
+            device_count={'GPU': 0},
+            intra_op_parallelism_threads=threads,
+            inter_op_parallelism_threads=1 if threads else 0
+        )
+        self.sess = tf.Session(graph=self.graph, config=config)
+        self.graph.finalize()
+        self.load_time = time.perf_counter() - start
+
+    def __call__(self, windows):
+        return self.sess.run(self.probs, feed_dict={self.windows: windows})
+
+    def predict(self, windows):
+        '''
+        Labels of the windows: 1 where the probability reaches the
+        calibrated threshold of the model.
+        '''
+        return (self(windows) >= self.threshold).astype(np.int64)
+
+    def close(self):
+        self.sess.close()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*
+
+import os
+import time
+import tensorflow as tf
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+
+class InputPipeline:
+    '''
+    Builds the tf.data pipelines feeding the model.
+
+    Input files are given as a glob, so the shards written by
+    generate_err_data.py (train-00000-of-00008.tfrecord, ...) are read
+    interleaved; a single file name works as well. Records are batched
+    first and parsed with one vectorised parse_example call per batch.
+    Parallelism and prefetching are left to the tf.data autotuner unless
+    set explicitly.
+
+    `cache` applies to evaluation data only: None disables it, '' keeps
+    the parsed batches in memory and any other string is a directory
+    for cache files, one per input pattern.
+
+    `remap` is an old -> new ID array from scripts/prune_vocab.py. Windows
+    written with the full vocabulary are mapped to the pruned one as they
+    are read, so the TFRecord files need not be rewritten.
+    '''
+    def __init__(
+            self,
+            winsize,
+            bsize,
+            epochs=1,
+            shuffle_buffer=10000,
+            cycle_length=4,
+            num_parallel_calls=AUTOTUNE,
+            prefetch=AUTOTUNE,
+            cache=None,
+            remap=None
+    ):
+        self.winsize = winsize
+        self.bsize = bsize
+        self.epochs = epochs
+        self.shuffle_buffer = shuffle_buffer
+        self.cycle_length = cycle_length
+        self.num_parallel_calls = num_parallel_calls
+        self.prefetch = prefetch
+        self.cache = cache
+        self.remap = remap
+
+    def _features(self):
+        return {
+            'sent': tf.FixedLenFeature(
+                shape=[self.winsize],
+                dtype=tf.int64
+            ),
+            'label': tf.FixedLenFeature(
+                shape=[1],
+                dtype=tf.int64
+            )
+        }
+
+    def remap_ids(self, sent):
+        if self.remap is None:
+            return sent
+        # A new constant per call: map functions each have their own graph
+        return tf.gather(tf.constant(self.remap, dtype=tf.int64), sent)
+
+    def _parse_batch(self, examples):
+        parsed = tf.parse_example(examples, self._features())
+        parsed['sent'] = self.remap_ids(parsed['sent'])
+        return parsed
+
+    def _records(self, pattern, training):
+        files = tf.data.Dataset.list_files(pattern, shuffle=training)
+        return files.apply(
+            tf.data.experimental.parallel_interleave(
+                tf.data.TFRecordDataset,
+                cycle_length=self.cycle_length,
+                sloppy=training
+            )
+        )
+
+    def _cache_file(self, pattern):
+        name = tf.strings.regex_replace(pattern, r'[^\w.-]', '_')
+        return tf.strings.join([self.cache + os.sep, name, '.cache'])
+
+    def train_dataset(self, pattern):
+        data = self._records(pattern, training=True)
+        data = data.shuffle(self.shuffle_buffer)
+        data = data.repeat(self.epochs)
+        data = data.batch(self.bsize)
+        data = data.map(
+            self._parse_batch,
+            num_parallel_calls=self.num_parallel_calls
+        )
+        return data.prefetch(self.prefetch)
+
+    def eval_dataset(self, pattern):
+        data = self._records(pattern, training=False)
+        data = data.batch(self.bsize)
+        data = data.map(
+            self._parse_batch,
+            num_parallel_calls=self.num_parallel_calls
+        )
+        if self.cache == '':
+            data = data.cache()
+        elif self.cache is not None:
+            data = data.cache(self._cache_file(pattern))
+        return data.prefetch(self.prefetch)
+
+
+def measure_input(sess, batch, n_batches=200):
+    '''
+    Examples per second the pipeline delivers on its own, without the
+    model. Pulls `n_batches` batches from the `batch` tensors, so the
+    iterator must be initialised and reinitialised afterwards.
+    '''
+    sess.run(batch)  # warm up, fills the shuffle buffer
+    n = 0
+    start = time.perf_counter()
+    for _ in range(n_batches):
+        try:
+            n += len(sess.run(batch['label']))
+        except tf.errors.OutOfRangeError:
+            break
+    return n / (time.perf_counter() - start)
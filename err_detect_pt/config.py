@@ -50,6 +50,9 @@ class Config:
         self.cache_dir = os.path.join(self.tmp_dir, 'cache')
         self.lemma_file = os.path.join(self.tmp_dir, 'lemmas.txt')
         self.surface_file = os.path.join(self.tmp_dir, 'surfaces.txt')
+        # Rows indexed by surface IDs, written by scripts/map_embeddings.py
+        # from surface_file and vector_file
+        self.embedding_file = os.path.join(self.tmp_dir, 'embeddings.npy')
         self.vector_file = os.path.join(
             self.tmp_dir,
             LANG_MAP[self.lang]['vectors']
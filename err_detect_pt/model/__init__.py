@@ -48,8 +48,9 @@ class Model(nn.Module):
     def forward(self, x):
         lstm_out, _ = self.lstm(x)
         lr_ctx = lstm_out[:,self.win_rad,:]
-        # t_emb = x[:,self.win_rad,:]
-        # ctx = torch.cat((lr_ctx, t_emb), 1)
-        scores = self.mlp(lr_ctx)
+        # The MLP sees the context and the centre word's own embedding
+        t_emb = x[:,self.win_rad,:]
+        ctx = torch.cat((lr_ctx, t_emb), 1)
+        scores = self.mlp(ctx)
 
         return scores
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+'''
+Online scoring server.
+
+POST /score with {"text": "..."} answers with the tokens of every
+sentence and, per token, the score of its window and its label, 1 if
+the score reaches the model's threshold and 0 otherwise (both null for
+tokens that map to no window). GET /metrics gives request counts, latency
+percentiles and batch sizes.
+
+Requests are handled by an asyncio HTTP server. Tokenization, analysis
+and windowing run in one worker thread that owns the analyser and its
+caches. Windows from concurrent requests are scored together by a
+batching.BatchScheduler.
+
+The model is the best.pt of a run saved by trainer.Trainer, and the
+embeddings are cfg.embedding_file (see Scorer.from_run). Training
+needs err_detect_pt.pipeline, which is not written yet.
+'''
+
+import os
+import copy
+import json
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from tokenizer import Tokenizer
+from utils import batching
+from utils import dataset
+from utils import pipeline
+from utils import quantize as quant
+from utils import vocab
+
+from . import cfg
+from . import model
+
+STATUS = {
+    200: '200 OK',
+    400: '400 Bad Request',
+    404: '404 Not Found',
+    405: '405 Method Not Allowed',
+    500: '500 Internal Server Error'
+}
+# Calibrated thresholds of a run per quantisation mode, written by
+# scripts/eval_quantized.py
+QUANTIZE_FILE = 'quantize.json'
+
+
+class Preprocessor:
+    '''
+    Text -> windows of surface IDs. The tokenizer, analyser and
+    vocabularies stay loaded between requests, and the analyser keeps
+    its in-memory and on-disk caches warm.
+    '''
+    def __init__(self, lang, cache_size=200000):
+        self.lang = lang
+        self.tokenizer = Tokenizer(lang)
+        self.analyser = pipeline.MemoAnalyser(lang, cache_size=cache_size)
+        self.vomap = dataset.VocabMap(
+            vocab.load_frozen(cfg.surface_file, lang),
+            vocab.load_frozen(cfg.lemma_file, lang),
+            lang,
+            locked=True
+        )
+        self.pad = self.vomap.surf_vocab[vocab.padding_label]
+
+    def __call__(self, text):
+        '''
+        Sentences as lists of tokens, the windows to score and for every
+        token the index of its window, or None.
+        '''
+        sents = self.tokenizer.tokenize(text)
+        windows, positions = pipeline.map_windows(
+            sents,
+            self.analyser,
+            self.vomap,
+            self.lang,
+            cfg.window_rad
+        )
+        return sents, windows, positions
+
+    def save(self):
+        self.analyser.save()
+
+
+def quantize_dynamic(net):
+    return torch.quantization.quantize_dynamic(
+        net,
+        {torch.nn.LSTM, torch.nn.Linear},
+        dtype=torch.qint8
+    )
+
+
+class Scorer:
+    '''
+    Scores windows of surface IDs with `net`, looking their inputs up in
+    `embeddings`, an array with one row per surface ID. Scores from
+    `threshold` up are labelled positive.
+    '''
+    def __init__(self, net, embeddings, device, threshold=0.5):
+        self.net = net.to(device)
+        self.net.eval()
+        self.embeddings = embeddings
+        self.device = device
+        self.win_rad = net.win_rad
+        self.threshold = threshold
+
+    @staticmethod
+    def from_run(run_path, force_cpu=False, quantize='none'):
+        '''
+        The model of a run, restored from its best checkpoint (best.pt,
+        written by Trainer.save). The hyperparameters are read off the
+        weight shapes. The embeddings are cfg.embedding_file, with one
+        row per surface ID of cfg.surface_file. See Scorer.quantized for
+        `quantize`; a quantised model uses the threshold calibrated for
+        it, if any.
+        '''
+        device = model.get_device(force_cpu or quantize == 'int8')
+        ckp = torch.load(
+            os.path.join(cfg.run_dir, run_path, 'best.pt'),
+            map_location=device
+        )
+        state = ckp['model']
+        layers = sum(
+            1 for k in state
+            if k.startswith('lstm.weight_ih_l') and not k.endswith('_reverse')
+        )
+        net = model.Model(
+            state['lstm.weight_ih_l0'].shape[1],
+            state['lstm.weight_hh_l0'].shape[1],
+            state['mlp.3.weight'].shape[0],
+            layers,
+            0.0,
+            cfg.window_rad,
+            state['mlp.6.weight'].shape[0]
+        )
+        net.load_state_dict(state)
+        if not os.path.isfile(cfg.embedding_file):
+            raise FileNotFoundError(
+                f'No embeddings {cfg.embedding_file}, map them with'
+                f' scripts/map_embeddings.py {cfg.surface_file}'
+                f' {cfg.vector_file} {cfg.embedding_file}'
+            )
+        embeddings = quant.load_embeddings(cfg.embedding_file, quantize)
+        if embeddings.shape[1] != net.lstm.input_size:
+            raise ValueError(
+                f'{cfg.embedding_file} has {embeddings.shape[1]}-d rows,'
+                f' the model takes {net.lstm.input_size}-d embeddings'
+            )
+        if quantize == 'int8':
+            net = quantize_dynamic(net)
+        threshold = 0.5
+        calib_file = os.path.join(cfg.run_dir, run_path, QUANTIZE_FILE)
+        if quantize != 'none' and os.path.isfile(calib_file):
+            with open(calib_file, 'r') as f:
+                threshold = json.load(f).get(quantize, threshold)
+        return Scorer(net, embeddings, device, threshold)
+
+    def quantized(self, mode='int8'):
+        '''
+        A reduced precision copy: float16 or int8 embeddings, for int8
+        also the LSTM and Linear layers with dynamic int8 quantisation
+        (weights in int8, activations quantised on the fly), which runs
+        on CPU only.
+        '''
+        if mode == 'none':
+            return self
+        net = copy.deepcopy(self.net)
+        device = self.device
+        if mode == 'int8':
+            device = torch.device('cpu')
+            net = quantize_dynamic(net.to(device))
+        return Scorer(
+            net,
+            quant.QuantizedEmbeddings.from_array(self.embeddings, mode),
+            device
+        )
+
+    def __call__(self, windows):
+        '''
+        Score of every window: the probability of the centre word when
+        the model predicts words, of the positive class otherwise.
+        '''
+        x = torch.from_numpy(
+            np.asarray(self.embeddings[windows], dtype=np.float32)
+        ).to(self.device)
+        with torch.no_grad():
+            out = self.net(x)
+        if out.shape[1] == 1:
+            probs = torch.sigmoid(out[:, 0])
+        elif out.shape[1] == 2:
+            probs = torch.softmax(out, dim=1)[:, 1]
+        else:
+            centres = torch.from_numpy(windows[:, self.win_rad]).long().to(self.device)
+            probs = torch.softmax(out, dim=1).gather(1, centres.unsqueeze(1))[:, 0]
+        return probs.cpu().numpy()
+
+
+class Metrics:
+    '''
+    Request counts and latency percentiles over the last `window`
+    requests.
+    '''
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def add(self, latency):
+        self.requests += 1
+        self.latencies.append(latency)
+
+    def report(self, batches):
+        lat = np.array(self.latencies) * 1000
+        report = {'requests': self.requests, 'errors': self.errors}
+        if len(lat):
+            report.update(
+                p50_ms=float(np.percentile(lat, 50)),
+                p99_ms=float(np.percentile(lat, 99)),
+                max_ms=float(lat.max())
+            )
+        report.update(batches)
+        return report
+
+
+class ScoringServer:
+    def __init__(self, make_preprocessor, make_scorer, max_batch=256, max_wait=0.005):
+        self.make_preprocessor = make_preprocessor
+        self.make_scorer = make_scorer
+        # The analyser cache is not thread safe and its SQLite store is
+        # bound to the thread that opened it: one thread owns it.
+        self.prep_pool = ThreadPoolExecutor(max_workers=1)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = Metrics()
+
+    async def start(self, host='0.0.0.0', port=5010):
+        loop = asyncio.get_event_loop()
+        self.preprocess = await loop.run_in_executor(self.prep_pool, self.make_preprocessor)
+        scorer = await loop.run_in_executor(None, self.make_scorer)
+        self.threshold = getattr(scorer, 'threshold', 0.5)
+        self.batcher = batching.BatchScheduler(
+            scorer,
+            self.max_batch,
+            self.max_wait,
+            pad=getattr(self.preprocess, 'pad', 0)
+        )
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher.close()
+        if hasattr(self.preprocess, 'save'):
+            await asyncio.get_event_loop().run_in_executor(self.prep_pool, self.preprocess.save)
+
+    async def score(self, text):
+        loop = asyncio.get_event_loop()
+        sents, windows, positions = await loop.run_in_executor(
+            self.prep_pool,
+            self.preprocess,
+            text
+        )
+        probs = await asyncio.wrap_future(self.batcher.submit(windows))
+        return {
+            'sentences': [
+                [
+                    {
+                        'token': token,
+                        'score': None if k is None else float(probs[k]),
+                        'label': None if k is None else int(probs[k] >= self.threshold)
+                    }
+                    for token, k in zip(sent, pos)
+                ]
+                for sent, pos in zip(sents, positions)
+            ]
+        }
+
+    async def route(self, method, path, body):
+        if path == '/metrics':
+            return 200, self.metrics.report(self.batcher.stats())
+        if path != '/score':
+            return 404, {'error': f'No such endpoint {path}'}
+        if method != 'POST':
+            return 405, {'error': 'Use POST'}
+        try:
+            text = json.loads(body.decode('utf-8'))['text']
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': 'Expected {"text": ...}'}
+        start = time.perf_counter()
+        try:
+            result = await self.score(text)
+        except Exception as ex:
+            self.metrics.errors += 1
+            return 500, {'error': f'{type(ex).__name__}: {ex}'}
+        self.metrics.add(time.perf_counter() - start)
+        return 200, result
+
+    async def handle(self, reader, writer):
+        '''
+        Minimal HTTP/1.1 with keep-alive, enough for JSON requests.
+        '''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, _ = line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self.route(method, path, body)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f'HTTP/1.1 {STATUS[status]}\r\n'
+                    'Content-Type: application/json; charset=utf-8\r\n'
+                    f'Content-Length: {len(data)}\r\n\r\n'.encode('latin-1')
+                    + data
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def serve(args):
+    server = ScoringServer(
+        lambda: Preprocessor(cfg.lang),
+        lambda: Scorer.from_run(args.run_path, args.force_cpu, args.quantize),
+        max_batch=args.max_batch,
+        max_wait=args.max_wait / 1000
+    )
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start(port=args.port))
+    print(f'Serving on port {args.port}')
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        print('Stopping...')
+    finally:
+        loop.run_until_complete(server.stop())
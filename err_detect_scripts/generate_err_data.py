@@ -26,8 +26,10 @@ from utils import utils
 from utils import dataset
 from utils import vocab
 from utils import pipeline
+from utils import freq
 import time
 import csv
+import multiprocessing as mp
 
 from polyglot.text import Text
 
@@ -37,6 +39,9 @@ LANG = 'Finnish'
 window_rad = 10
 max_lemmas = 5
 stride = 3
+# More than one worker builds TFRecord shards in parallel, see
+# build_parallel
+n_workers = 1
 
 
 def hs_mongo():
@@ -60,12 +65,12 @@ def load_vocab(vocab_file):
     return vo, new
 
 
-def make_windows(adoc, stride):
-    return utils.SlidingWindow(
-        adoc,
+def make_windows(ids, stride):
+    return utils.sliding_windows(
+        ids,
         window_rad,
         stride,
-        pad=vomap(dataset.PAD)
+        pad=vomap(dataset.PAD).surface
     )
 
 
@@ -83,38 +88,35 @@ def window_to_example(window, label, format):
         return window_to_example_form(window, label)
     elif format == 'csv':
         return window_to_example_csv(window, label)
+    elif format == 'csv_token':
+        return window_to_example_csv(window, label, token=True)
+
+
+def n_special(format):
+    '''
+    Windows with more than half of the tokens below this ID are skipped.
+    '''
+    if format == 'tfrecord':
+        return 6  # pad, unk, num, punct, name, lat
+    else:
+        return 2  # pad, unk
 
 
 def window_to_example_csv(window, label, token=None):
     sent = [label]
-    pad_unk = 0
-    for i, word in enumerate(window):
-        if word.surface in [0, 1]:
-            pad_unk += 1
+    for surface in window.tolist():
         if token:
-            if word == ',':
-                word = '#'
-            s = vomap.surf_vocab[word.surface]
-            sent.append(s)
+            sent.append(vomap.surf_vocab[surface])
         else:
-            sent.append(word.surface)
-    if pad_unk > 0.5 * (window_rad * 2 + 1):
-        return None
-    else:
-        return sent
+            sent.append(surface)
+    return sent
 
 
 def window_to_example_form(window, label):
-    pad_unk = 0
-    sent = np.empty(len(window), dtype=int)
-    for i, word in enumerate(window):
-        if word.surface in range(6):  # pad, unk, num, punct, name, lat
-            pad_unk += 1
-        sent[i] = word.surface
     feature = {
         'sent': tf.train.Feature(
             int64_list=tf.train.Int64List(
-                value=sent
+                value=window.tolist()
             )
         ), 'label': tf.train.Feature(
             int64_list=tf.train.Int64List(
@@ -126,10 +128,7 @@ def window_to_example_form(window, label):
             feature=feature
         )
     )
-    if pad_unk > 0.5 * (window_rad * 2 + 1):  # remove phrase with too many pads, unk, names, lat, punct
-        return None
-    else:
-        return example.SerializeToString()
+    return example.SerializeToString()
 
 
 
@@ -186,6 +185,8 @@ def build_train_form_predict(in_file, freq_dict, format):
     docs = pipeline.BatchTokenizer(LANG, in_file)
     pos = 0
     neg = 0
+    n_spec = n_special(format)
+    max_special = 0.5 * (window_rad * 2 + 1)
 
     for doc in tqdm(docs, total=total):
         if not doc:
@@ -205,18 +206,22 @@ def build_train_form_predict(in_file, freq_dict, format):
                                 vomap,
                                 LANG, names,
                                 freq_dict)
-        windows = make_windows(list(dm), stride)
-        for window in windows:
-            assert len(window) == (window_rad * 2) + 1
-            median = window[window_rad]
+        mapped = dm.to_document()
+        ids = mapped.surfaces
+        n_lemmas = mapped.lemma_counts()
+        windows = make_windows(ids, stride)
+        # Too many pads, unk, names, lat, punct: no example
+        special = utils.special_counts(windows, n_spec)
+        for k, window in enumerate(windows):
+            median = int(ids[k * stride])
+            keep = special[k] <= max_special
             # if the word is unambiguous
-            if len(median.lemmas) == 1:
+            if n_lemmas[k * stride] == 1:
                 # positive example.;
-                p_example = window_to_example(window, 1, format)
-                if random.uniform(0, 1) > 0.60 and p_example:  # save only half of all positive forms
+                if random.uniform(0, 1) > 0.60 and keep:  # save only half of all positive forms
                     pos += 1
-                    write(p_example, format, positive=True)
-                surface = vomap.surf_vocab[median.surface].lower()
+                    write(window_to_example(window, 1, format), format, positive=True)
+                surface = vomap.surf_vocab[median].lower()
                 neg_num = 1
                 negative_forms = get_forms(surface, neg_num)
 
@@ -224,35 +229,176 @@ def build_train_form_predict(in_file, freq_dict, format):
                     for f in negative_forms:
                         if f.replace('ё', 'е') != surface:
                             findex = vomap.surf_vocab.add(f)
-                            replacement = dataset.Word(surface=findex,
-                                                       lemmas=median.lemmas,
-                                                       pos=median.pos)
-                            window[window_rad] = replacement
+                            n_window = window.copy()
+                            n_window[window_rad] = findex
+                            n_special_count = (
+                                special[k]
+                                - (median < n_spec)
+                                + (findex < n_spec)
+                            )
                             # create negative example
-                            n_example = window_to_example(window, 0, format)
-                            if n_example:
+                            if n_special_count <= max_special:
                                 neg += 1
-                                write(n_example, format, negative=True)
+                                write(window_to_example(n_window, 0, format), format, negative=True)
                 # print("Done with negative forms")
             else:
                 # create positive window
-                p_example = window_to_example(window, 1, format)
-                if random.uniform(0, 1) > 0.60 and p_example:
-                    write(p_example, format, positive=True)
+                if random.uniform(0, 1) > 0.60 and keep:
+                    write(window_to_example(window, 1, format), format, positive=True)
                     pos += 1
     print(f'Positive ex: {pos}, Negative ex: {neg}')
     print(f'Overall time: {time.time() - t_overall_started}')
 
 
+def make_analyser():
+    # Bounded analysis cache, keeps the most frequent corpus words in memory
+    return pipeline.MemoAnalyser(
+        language,
+        cache_size=500000,
+        policy='freq',
+        freq_dict=freq_dict
+    )
+
+
+def shard_name(fname, shard, n_shards):
+    root, ext = os.path.splitext(fname)
+    return f'{root}-{shard:05d}-of-{n_shards:05d}{ext}'
+
+
+def split_corpus(in_file, n_shards, shard_dir):
+    '''
+    Distribute the documents of `in_file` round-robin over `n_shards`
+    text files, so that each worker tokenizes and caches its own part.
+    '''
+    if not os.path.isdir(shard_dir):
+        os.makedirs(shard_dir)
+    shard_files = [
+        shard_name(os.path.join(shard_dir, 'corpus.txt'), i, n_shards)
+        for i in range(n_shards)
+    ]
+    outs = [open(f, 'w', encoding='utf-8') for f in shard_files]
+    with codecs.open(in_file, 'r', encoding='utf-8', errors='ignore') as inf:
+        for i, doc in enumerate(filter(bool, inf)):
+            outs[i % n_shards].write(doc)
+    for out in outs:
+        out.close()
+    return shard_files
+
+
+def build_shard(shard, shard_file, train_file, valid_file, format):
+    '''
+    Worker: build the examples of one corpus shard with its own
+    analyser and TFRecord writers. The vocabularies loaded in the parent
+    are shared read-only, new words get provisional IDs in a DeltaVocab
+    which merge_shards() maps to global ones.
+    Relies on the module globals set up in __main__ being inherited
+    through fork().
+    '''
+    global vomap, analyser, writer_train, writer_valid
+    random.seed()
+    vomap = dataset.VocabMap(
+        vocab.DeltaVocab(base_surf_vocab),
+        vocab.DeltaVocab(base_lemma_vocab),
+        LANG
+    )
+    analyser = make_analyser()
+    writer_train = tf.python_io.TFRecordWriter(train_file)
+    writer_valid = tf.python_io.TFRecordWriter(valid_file)
+    build_train_form_predict(shard_file, freq_dict, format)
+    writer_train.close()
+    writer_valid.close()
+    analyser.save()
+    return {
+        'surfaces': vomap.surf_vocab.delta(),
+        'lemmas': vomap.lemma_vocab.delta()
+    }
+
+
+def remap_shard(tmp_file, writer, remap, base):
+    '''
+    Append a shard to `writer`, replacing shard-local surface IDs by
+    global ones. Records made only of words from the base vocabulary are
+    copied as is.
+    '''
+    for record in tf.python_io.tf_record_iterator(tmp_file):
+        example = tf.train.Example.FromString(record)
+        sent = example.features.feature['sent'].int64_list
+        if max(sent.value) >= base:
+            ids = remap[np.asarray(sent.value)]
+            del sent.value[:]
+            sent.value.extend(ids.tolist())
+            record = example.SerializeToString()
+        writer.write(record)
+    os.remove(tmp_file)
+
+
+def merge_shards(results, tmp_files, out_files):
+    '''
+    Reconcile the shard vocabularies: add the new words of every shard
+    to the global vocabulary in shard order, then concatenate the shards
+    into the train and valid files `out_files` with the global IDs.
+    '''
+    global vomap
+    vomap = dataset.VocabMap(surf_vocab, lemma_vocab, LANG)
+    base = len(vomap.surf_vocab)
+    remaps = vocab.merge_deltas(
+        vomap.surf_vocab,
+        [res['surfaces'] for res in results]
+    )
+    vocab.merge_deltas(
+        vomap.lemma_vocab,
+        [res['lemmas'] for res in results]
+    )
+    writers = [tf.python_io.TFRecordWriter(f) for f in out_files]
+    for remap, tmps in zip(remaps, tmp_files):
+        remap = np.asarray(remap, dtype=np.int64)
+        for tmp, writer in zip(tmps, writers):
+            remap_shard(tmp, writer, remap, base)
+    for writer in writers:
+        writer.close()
+    vomap.save()
+
+
+def build_parallel(in_file, train_file, valid_file, format, n_shards):
+    '''
+    Sharded version of build_train_form_predict: every worker process
+    writes its own train/valid TFRecord shard, and the shards are merged
+    into `train_file` and `valid_file`.
+    '''
+    if format != 'tfrecord':
+        raise ValueError('Parallel generation supports only tfrecord.')
+    shard_dir = os.path.join(os.path.dirname(train_file), 'shards')
+    shard_files = split_corpus(in_file, n_shards, shard_dir)
+    tmp_files = [
+        (
+            shard_name(os.path.join(shard_dir, 'train.tfrecord'), i, n_shards),
+            shard_name(os.path.join(shard_dir, 'valid.tfrecord'), i, n_shards)
+        )
+        for i in range(n_shards)
+    ]
+    tasks = [
+        (i, shard_files[i], tmps[0], tmps[1], format)
+        for i, tmps in enumerate(tmp_files)
+    ]
+    # Loaded once here and shared with the forked workers
+    global base_surf_vocab, base_lemma_vocab
+    base_surf_vocab, _ = load_vocab(surf_vocab)
+    base_lemma_vocab, _ = load_vocab(lemma_vocab)
+    with mp.get_context('fork').Pool(n_shards) as pool:
+        results = pool.starmap(build_shard, tasks)
+    print('Merging vocabularies...')
+    merge_shards(results, tmp_files, (train_file, valid_file))
+    for f in shard_files:
+        os.remove(f)
+
+
 if __name__ == '__main__':
     language = 'Russian'
-    analyser = Analyzer(language)
     surf_vocab = 'experiments/ErrData/ru/new_data/surfaces.txt'
     lemma_vocab = 'experiments/ErrData/ru/new_data/lemmas.txt'
     freq_dict_json = '/experiments/ErrData/ru/new_data/freq_dict.json'
 
     inflections_file = '../../new_final_inflections.json'
-    vomap = dataset.VocabMap(surf_vocab, lemma_vocab, LANG)
     neg_examples = True
     with_db = False
     format = 'tfrecord'
@@ -262,9 +408,9 @@ if __name__ == '__main__':
     with codecs.open(inflections_file, 'r', encoding='utf-8') as f:
        inflections = json.load(f)
 
-    # Use freq dict to exclude rare words
-    with codecs.open(freq_dict_json, 'r', encoding='utf-8') as fd:
-        freq_dict = json.load(fd)
+    # Use freq dict to exclude rare words. A table written by
+    # scripts/make_frequency_dict.py is memory-mapped, not loaded.
+    freq_dict = freq.load(freq_dict_json)
     in_file = 'Projects/russian/text.txt'
 
     if format == 'csv':
@@ -272,10 +418,25 @@ if __name__ == '__main__':
                 codecs.open('/experiments/ErrData/ru/csv_kp_data/positive.csv', mode='w') as positive_csv_file:
             writer_negative = csv.writer(negative_csv_file, delimiter='|', quotechar='"', quoting=csv.QUOTE_MINIMAL)
             writer_positive = csv.writer(positive_csv_file, delimiter='|', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            vomap = dataset.VocabMap(surf_vocab, lemma_vocab, LANG)
+            analyser = make_analyser()
             print('Building training instances')
             format = 'csv_token'
             build_train_form_predict(in_file, freq_dict, format)
             print('Writing files...')
+            vomap.save()
+            analyser.save()
+            print('Analysis cache:', analyser.stats())
+
+    elif format == 'tfrecord' and n_workers > 1:
+        out_train_file = '/experiments/ErrData/ru/small_data/train.tfrecord'
+        out_valid_file = '/experiments/ErrData/ru/small_data/valid.tfrecord'
+        out_additional_test_file = '/experiments/ErrData/ru/new_data/random_pos.tfrecord'
+        # Same files as the serial branch below: train.tfrecord is
+        # created, the train split goes to the random_pos writer
+        tf.python_io.TFRecordWriter(out_train_file).close()
+        print(f'Building training instances with {n_workers} workers')
+        build_parallel(in_file, out_additional_test_file, out_valid_file, format, n_workers)
 
     elif format == 'tfrecord':
         out_train_file = '/experiments/ErrData/ru/small_data/train.tfrecord'
@@ -284,8 +445,12 @@ if __name__ == '__main__':
         writer_train = tf.python_io.TFRecordWriter(out_train_file)
         writer_valid = tf.python_io.TFRecordWriter(out_valid_file)
         writer_train = tf.python_io.TFRecordWriter(out_additional_test_file)
+        vomap = dataset.VocabMap(surf_vocab, lemma_vocab, LANG)
+        analyser = make_analyser()
 
         print('Building training instances')
         build_train_form_predict(in_file, freq_dict, format)
         print('Writing files...')
-    vomap.save()
+        vomap.save()
+        analyser.save()
+        print('Analysis cache:', analyser.stats())
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import os
+import glob
+import time
+import itertools
 
 import petname
 import tensorflow as tf
@@ -11,8 +14,14 @@ from tensorboard.plugins.custom_scalar import layout_pb2
 import csv
 
 from er_detect_model import ErDetectModel
+from er_detect_model.input_pipeline import InputPipeline, measure_input, AUTOTUNE
+from er_detect_model.export import export_model
+from tokenizer import Tokenizer
 from utils import vocab
 from utils import utils
+from utils import dataset
+from utils import freq
+from utils import pipeline
 
 import codecs
 windowrad = 10
@@ -22,8 +31,8 @@ winsize = (windowrad * 2) + 1
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 language = 'Russian'
-surf_vocab = vocab.Vocab.load('/experiments/ErrData/ru/surfaces.txt', language)
-lemma_vocab = vocab.Vocab.load('/experiments/ErrData/ru/lemmas.txt', language)
+surf_vocab = vocab.load_frozen('/experiments/ErrData/ru/surfaces.txt', language)
+lemma_vocab = vocab.load_frozen('/experiments/ErrData/ru/lemmas.txt', language)
 
 print_every = 100
 eval_every = 2000
@@ -40,12 +49,38 @@ def new_run_dir():
     return run_dir
 
 
-def load_pretrained(sess, model, emb_file):
-    pretrained = np.float32(np.load(emb_file))
-    sess.run(
-        model.set_pretrain,
-        feed_dict={model.pretrain_ph: pretrained}
-    )
+def load_pretrained(sess, model, emb_file, rows=65536):
+    '''
+    Copy the embeddings into the input weights `rows` rows at a time.
+    '''
+    n_rows = np.load(emb_file, mmap_mode='r').shape[0]
+    if n_rows == model.vin - 1:
+        # Written by the old scripts/load_embeddings.py, which started
+        # at ID 1
+        raise ValueError(
+            f'{emb_file} has {n_rows} rows for {model.vin} input words, the'
+            ' old layout without ID 0; map the vectors again with'
+            ' scripts/map_embeddings.py'
+        )
+    start = time.perf_counter()
+    n = 0
+    for offset, block in utils.npy_chunks(emb_file, rows):
+        sess.run(
+            model.set_pretrain,
+            feed_dict={
+                model.pretrain_ph: block.astype(np.float32, copy=False),
+                model.pretrain_offset: offset
+            }
+        )
+        n += len(block)
+    if n != model.vin:
+        print(f'Warning: {n} pretrained embeddings for {model.vin} input words')
+    print(f'Loaded {n} embeddings in {time.perf_counter() - start:.1f}s')
+
+
+def report_memory(stage):
+    rss, peak = utils.memory_usage()
+    print(f'Memory {stage}: {rss:.0f} MiB resident, {peak:.0f} MiB peak')
 
 
 def train_model(sess, model, run_dir, ckp_every=20000, max_steps=-1):
@@ -61,33 +96,52 @@ def train_model(sess, model, run_dir, ckp_every=20000, max_steps=-1):
         sess.graph
     )
 
-    sess.run(
-        model.train_it.initializer,
-        feed_dict={
-            model.train_file: args.input_file,
-        }
-    )
+    def init_train():
+        sess.run(
+            model.train_it.initializer,
+            feed_dict={
+                model.train_file: args.input_file,
+            }
+        )
+
+    init_train()
+    if getattr(args, 'bench_input', 0):
+        # Input pipeline alone, to tell it apart from the model step time
+        display.update(msg='Measuring input pipeline...')
+        eps = measure_input(sess, model.train_instances, args.bench_input)
+        display.update(input=f'{eps:.1f} examples/sec')
+        init_train()
+        display.update(msg='Training model...')
     step = 0
     closs = 0
     cacc = 0
     n = 0
     summaries = None
+    step_time = 0
 
     while True:
         try:
             if step == max_steps:
                 break
+            t_step = time.perf_counter()
             _, loss, train_acc, step = sess.run([
                 model.train_op,
                 model.objective,
                 model.train_accuracy,
                 model.global_step,
             ])
+            step_time += time.perf_counter() - t_step
             closs += loss
             cacc += train_acc
             if step % print_every == 0:
                 cacc = cacc / print_every
-                display.update(step=step, loss=closs / print_every, tacc=cacc)
+                display.update(
+                    step=step,
+                    loss=closs / print_every,
+                    tacc=cacc,
+                    steptime=f'{step_time / print_every * 1000:.1f} ms'
+                )
+                step_time = 0
                 summaries = sess.run(
                     model.train_summaries,
                     feed_dict={model.trainacc_ph: cacc}
@@ -180,29 +234,220 @@ def eval_model(sess, model, step=None, writer=None, mode=None, csv_writer=None):
 
 
 
-def infer(sess, model):
-    sess.run(
-        [
-            model.valid_it.initializer
-        ],
-        feed_dict={
-            model.valid_file: args.test_file
+def load_remap(args):
+    '''
+    Old -> new surface IDs of a pruned vocabulary, see
+    scripts/prune_vocab.py, or None.
+    '''
+    fname = getattr(args, 'remap', None)
+    return np.load(fname) if fname else None
+
+
+def input_size(remap):
+    return len(surf_vocab) if remap is None else int(remap.max()) + 1
+
+
+def is_tfrecord(fname):
+    return 'tfrecord' in os.path.basename(fname)
+
+
+def rebatch(chunks, bsize):
+    '''
+    Cut a stream of column chunks of any length into batches of
+    `bsize` rows, the last one possibly shorter.
+    '''
+    pending = []
+    n = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        n += len(chunk['doc'])
+        if n < bsize:
+            continue
+        merged = {
+            k: np.concatenate([c[k] for c in pending])
+            for k in chunk
         }
-    )
+        for start in range(0, n - bsize + 1, bsize):
+            yield {k: v[start:start + bsize] for k, v in merged.items()}
+        rest = n % bsize
+        pending = [{k: v[n - rest:] for k, v in merged.items()}] if rest else []
+        n = rest
+    if n:
+        yield {
+            k: np.concatenate([c[k] for c in pending])
+            for k in pending[0]
+        }
+
+
+def text_chunks(fname, radius, n_docs=256, remap=None, freq_file=None):
+    '''
+    Windows around every token of a raw text file, one document per
+    line, with the line number and the token offset in the document.
+    Documents are mapped as for training, see pipeline.map_windows;
+    with `freq_file` words seen at most once map to the unknown label.
+    '''
+    tok = Tokenizer(language)
+    analyser = pipeline.MemoAnalyser(language)
+    vomap = dataset.VocabMap(surf_vocab, lemma_vocab, language, locked=True)
+    freq_dict = freq.load(freq_file) if freq_file else None
+    with codecs.open(fname, 'r', encoding='utf-8', errors='ignore') as f:
+        lines = enumerate(f)
+        while True:
+            chunk = list(itertools.islice(lines, n_docs))
+            if not chunk:
+                break
+            batch = [(doc, line) for doc, line in chunk if line.strip()]
+            if not batch:
+                continue
+            docs = tok.tokenize_many([line for _, line in batch])
+            for (doc, _), sents in zip(batch, docs):
+                windows, positions = pipeline.map_windows(
+                    sents,
+                    analyser,
+                    vomap,
+                    language,
+                    radius,
+                    freq_dict=freq_dict
+                )
+                rows = [k for sent in positions for k in sent]
+                token = [i for i, k in enumerate(rows) if k is not None]
+                if not token:
+                    continue
+                windows = windows[[k for k in rows if k is not None]]
+                if remap is not None:
+                    windows = remap[windows]
+                yield {
+                    'sent': windows.astype(np.int64),
+                    'doc': np.full(len(token), doc, dtype=np.int32),
+                    'token': np.array(token, dtype=np.int32)
+                }
+    analyser.save()
+
+
+def build_infer_graph(model, bsize, current):
+    '''
+    One iterator fed either from a TFRecord file or, through a Python
+    generator reading current['file'], from raw text. Batches are
+    prefetched, so reading and windowing overlap with the network.
+    '''
+    winsize = model.winsize
+    types = {'sent': tf.int64, 'doc': tf.int32, 'token': tf.int32}
+    shapes = {
+        'sent': tf.TensorShape([None, winsize]),
+        'doc': tf.TensorShape([None]),
+        'token': tf.TensorShape([None])
+    }
 
-    pred = sess.run(
-        [
-            model.raw_valid_pred
-        ]
+    def parse_records(index, examples):
+        parsed = tf.parse_example(
+            examples,
+            {'sent': tf.FixedLenFeature(shape=[winsize], dtype=tf.int64)}
+        )
+        index = tf.cast(index, tf.int32)
+        return {
+            'sent': model.input_pipeline.remap_ids(parsed['sent']),
+            'doc': tf.fill(tf.shape(index), -1),
+            'token': index
+        }
+
+    file_ph = tf.placeholder(tf.string, shape=[])
+    records = tf.data.Dataset.zip((
+        tf.data.Dataset.range(2**31 - 1),
+        tf.data.TFRecordDataset(file_ph)
+    ))
+    records = records.batch(bsize).map(
+        parse_records,
+        num_parallel_calls=AUTOTUNE
+    ).prefetch(AUTOTUNE)
+    text = tf.data.Dataset.from_generator(
+        lambda: rebatch(
+            text_chunks(
+                current['file'],
+                args.window_radius,
+                remap=model.input_pipeline.remap,
+                freq_file=getattr(args, 'freq_dict', None)
+            ),
+            bsize
+        ),
+        output_types=types,
+        output_shapes=shapes
+    ).prefetch(AUTOTUNE)
+
+    iterator = tf.data.Iterator.from_structure(types, shapes)
+    batch = iterator.get_next()
+    probs = tf.nn.sigmoid(model.run_network(batch['sent']))
+    return (
+        file_ph,
+        iterator.make_initializer(records),
+        iterator.make_initializer(text),
+        batch,
+        probs
     )
 
-    print(pred)
+
+def infer(sess, model):
+    '''
+    Score every window of the input files and write the probabilities
+    with their file, document and token offsets as columns to
+    args.output (see utils.load_columns). TFRecord windows have no
+    document, their doc is -1 and token the record number.
+    '''
+    files = [f for pattern in args.test_file for f in sorted(glob.glob(pattern))]
+    # The recurrent layer runs across the batch (see BaseModel.build_bilstm),
+    # so the training batch size is the default.
+    bsize = args.infer_batch or args.batch_size
+    current = {}
+    file_ph, init_records, init_text, batch, probs = build_infer_graph(
+        model,
+        bsize,
+        current
+    )
+    columns = {'file': np.int16, 'doc': np.int32, 'token': np.int32, 'prob': np.float32}
+    n = 0
+    start = time.perf_counter()
+    with utils.ColumnWriter(args.output, columns) as out:
+        for i, fname in enumerate(files):
+            print(f'Scoring {fname}')
+            if is_tfrecord(fname):
+                sess.run(init_records, feed_dict={file_ph: fname})
+            else:
+                current['file'] = fname
+                sess.run(init_text)
+            while True:
+                try:
+                    doc, token, prob = sess.run([batch['doc'], batch['token'], probs])
+                except tf.errors.OutOfRangeError:
+                    break
+                out.write(
+                    file=np.full(len(prob), i),
+                    doc=doc,
+                    token=token,
+                    prob=prob[:, 0]
+                )
+                n += len(prob)
+                if n // bsize % print_every == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f'\r{n} windows, {n / elapsed:.1f} windows/sec', end='')
+    with open(os.path.join(args.output, 'files.txt'), 'w') as f:
+        for fname in files:
+            print(fname, file=f)
+    elapsed = time.perf_counter() - start
+    print(f'\n{n} windows in {elapsed:.1f}s, {n / elapsed:.1f} windows/sec')
 
 
 def build_model(args):
-
+    winsize = (args.window_radius * 2) + 1
+    remap = load_remap(args)
+    pipeline = InputPipeline(
+        winsize,
+        args.batch_size,
+        args.epochs,
+        shuffle_buffer=getattr(args, 'shuffle_buffer', 10000),
+        cache=getattr(args, 'cache_valid', None),
+        remap=remap
+    )
     model = ErDetectModel(
-        len(surf_vocab),
+        input_size(remap),
         args.batch_size,
         args.epochs,
         (args.window_radius * 2) + 1,
@@ -211,6 +456,8 @@ def build_model(args):
         args.attention_size,
         args.l2_lambda,
         args.dropout,
+        pipeline,
+        getattr(args, 'rnn_backend', 'auto')
         )
     return model
 
@@ -226,6 +473,8 @@ if __name__ == '__main__':
         Step: {step}
         Train Loss: {loss}
         Train Accuracy: {tacc}
+        Step time: {steptime}
+        Input pipeline: {input}
         --------------------------
         Validation Loss: {vloss}
         Validation Accuracy: {acc}
@@ -243,10 +492,13 @@ if __name__ == '__main__':
             ap.save(os.path.join(run_dir, 'args.json'))
             print('Building model')
             model = build_model(args)
+            report_memory('after building the model')
             sess.run(model.init_op)
+            report_memory('after initialisation')
             if args.pretrained:
                 print('Loading pretrained')
                 load_pretrained(sess, model, args.pretrained)
+                report_memory('after loading pretrained embeddings')
             with utils.Display(dtxt) as display:
                 train_model(sess, model, run_dir)
         elif args.command == 'test':
@@ -280,3 +532,25 @@ if __name__ == '__main__':
             model.load(os.path.join(run_dir, 'checkpoints'))
             print('Loading model...')
             infer(sess, model)
+        elif args.command == 'export':
+            run_dir = args.run_path
+            arg_file = os.path.join(run_dir, 'args.json')
+            ap.load(arg_file)
+            checkpoint = args.checkpoint or tf.train.latest_checkpoint(
+                os.path.join(run_dir, 'checkpoints')
+            )
+            out_dir = args.output or os.path.join(run_dir, 'export')
+            print(f'Exporting {checkpoint}...')
+            remap = load_remap(args)
+            export_model(
+                checkpoint,
+                out_dir,
+                input_size(remap),
+                (args.window_radius * 2) + 1,
+                args.embed_dim,
+                args.lstm_size,
+                rnn_backend=args.rnn_backend,
+                quantize=args.quantize,
+                remap=remap
+            )
+            print(f'Frozen graph written to {out_dir}')
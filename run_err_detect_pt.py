@@ -0,0 +1,16 @@
+#!/cs/puls/pyenv/shims/python
+# -*- coding: utf-8 -*-
+
+from utils import utils
+
+
+if __name__ == '__main__':
+    ap = utils.FileArgparser('err_detect_pt_args.json')
+    args = ap.args
+    if args.command == 'serve':
+        from err_detect_pt import server
+        server.serve(args)
+    else:
+        # The PyTorch input pipeline (err_detect_pt.pipeline) is not
+        # written yet, train with run_er_detect.py
+        print(f'{args.command}: not implemented for the PyTorch model yet')
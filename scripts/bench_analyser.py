@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Micro-benchmark of the morphological analysers, in words/sec.
+
+Run it on two revisions with the same input to compare them, e.g.
+    python scripts/bench_analyser.py Finnish text.txt -n 100000 --per-word
+--per-word times analyze() alone, so the same command also runs on
+revisions without analyze_many or the compound parser memo.
+'''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+from analyser.analyzer_wrapper import Analyzer
+
+
+def read_words(fname, n):
+    words = []
+    with open(fname, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            words.extend(line.split())
+            if len(words) >= n:
+                break
+    return words[:n]
+
+
+def bench(name, fun, words, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fun(words)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:>14}: {len(words) / best:12.1f} words/sec ({best:.3f}s)')
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('language', type=str, help='Analyser language')
+    parser.add_argument('path', metavar='PATH', type=str, help='Text to analyse')
+    parser.add_argument('-n', type=int, default=50000, help='Number of tokens')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Repetitions, the best one is reported')
+    parser.add_argument('--per-word', action='store_true',
+                        help='Only time analyze() per word, which older revisions also have')
+    args = parser.parse_args()
+
+    words = read_words(args.path, args.n)
+    print(f'{len(words)} tokens, {len(set(words))} distinct')
+    analyser = Analyzer(args.language)
+    per_word = args.per_word or not hasattr(analyser, 'analyze_many')
+    # Warm up lazily loaded resources (e.g. the Finnish generator)
+    for word in words[:100]:
+        analyser.analyze(word)
+
+    bench(
+        'analyze',
+        lambda ws: [analyser.analyze(w) for w in ws],
+        words,
+        args.repeat
+    )
+    if per_word:
+        sys.exit(0)
+    bench('analyze_many', analyser.analyze_many, words, args.repeat)
+
+    # Share of lookup() time saved by the memoized compound parser
+    profile = getattr(analyser, 'profile', None)
+    parser = profile.compound_parser if profile else None
+    if parser and parser.parse_compound and not parser.cache_info().currsize:
+        # e.g. FinnishAnalyzer, which parses compounds on its own
+        print(f'{args.language} lookup does not use the compound parser')
+    elif parser and parser.parse_compound:
+        lookup_words = [analyser.pre_analyzer(w) for w in words]
+        profile.parse_compound = parser.function
+        uncached = bench('lookup', analyser.lookup_many, lookup_words, args.repeat)
+        profile.parse_compound = parser.parse_compound
+        cached = bench('lookup+memo', analyser.lookup_many, lookup_words, args.repeat)
+        print(f'Compound parser memo saves {1 - cached / uncached:.1%} of lookup time')
+        print(parser.cache_info())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Open-loop load test for utils.batching.BatchScheduler. Requests of one
+sentence each (a random number of windows) arrive as a Poisson process
+at every given rate; for each rate and max wait the throughput, latency
+percentiles and whether p99 stays within the SLO are printed.
+
+Backends: "synthetic" sleeps for a fixed overhead plus a cost per
+window, so the scheduler can be tuned without a model; "pt" runs the
+PyTorch network with random weights. The TensorFlow network is not
+offered: its LSTM runs along the batch axis, so its scores depend on
+the other windows of the batch (see utils/batching.py).
+    python scripts/bench_batching.py -b synthetic -r 100 500 2000 -w 0 2 5 10
+    python scripts/bench_batching.py -b pt -r 50 200 -s 256
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+import numpy as np
+
+from utils import batching
+
+
+def synthetic_scorer(args):
+    def score(batch):
+        time.sleep((args.overhead_ms + args.window_us * len(batch) / 1000) / 1000)
+        return np.zeros(len(batch), dtype=np.float32)
+    return score
+
+
+def pt_scorer(args):
+    import torch
+    from err_detect_pt import model
+    from err_detect_pt.server import Scorer
+
+    net = model.Model(
+        args.embed_dim,
+        args.lstm_size,
+        50,
+        1,
+        0.0,
+        args.window_radius,
+        1
+    )
+    embeddings = np.random.rand(args.vocab_size, args.embed_dim).astype(np.float32)
+    return Scorer(net, embeddings, model.get_device(False))
+
+
+SCORERS = {'synthetic': synthetic_scorer, 'pt': pt_scorer}
+
+
+def run_load(scheduler, rate, args):
+    '''
+    Latencies of the requests sent at `rate` per second for
+    args.seconds seconds, measured until their futures complete.
+    '''
+    winsize = 2 * args.window_radius + 1
+    latencies = []
+    lock = threading.Lock()
+
+    def done(sent):
+        def callback(_):
+            with lock:
+                latencies.append(time.perf_counter() - sent)
+        return callback
+
+    futures = []
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival - start < args.seconds:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        n = random.randint(args.min_len, args.max_len)
+        windows = np.random.randint(args.vocab_size, size=(n, winsize))
+        future = scheduler.submit(windows)
+        future.add_done_callback(done(time.perf_counter()))
+        futures.append(future)
+        next_arrival += random.expovariate(rate)
+    for future in futures:
+        future.result()
+    return np.array(latencies) * 1000, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--backend', choices=list(SCORERS), default='synthetic', help='What scores the batches')
+    parser.add_argument('-r', '--rates', type=float, nargs='+', default=[50, 200, 1000], help='Requests per second')
+    parser.add_argument('-w', '--max_waits', type=float, nargs='+', default=[0, 2, 5, 10], help='Max wait in ms')
+    parser.add_argument('-m', '--max_batch', type=int, default=256, help='Most windows per batch')
+    parser.add_argument('-l', '--slo', type=float, default=50.0, help='p99 latency target in ms')
+    parser.add_argument('-t', '--seconds', type=float, default=5.0, help='Duration per rate')
+    parser.add_argument('--min_len', type=int, default=5, help='Fewest windows per request')
+    parser.add_argument('--max_len', type=int, default=40, help='Most windows per request')
+    parser.add_argument('--overhead_ms', type=float, default=2.0, help='Synthetic cost per batch')
+    parser.add_argument('--window_us', type=float, default=20.0, help='Synthetic cost per window')
+    parser.add_argument('--window_radius', type=int, default=10, help='Radius of the context window')
+    parser.add_argument('-d', '--embed_dim', type=int, default=300, help='Embedding size')
+    parser.add_argument('-s', '--lstm_size', type=int, default=512, help='LSTM hidden size')
+    parser.add_argument('-v', '--vocab_size', type=int, default=100000, help='Input vocabulary size')
+    args = parser.parse_args()
+
+    score = SCORERS[args.backend](args)
+    print(f'{"rate":>7} {"wait":>5} {"req/s":>8} {"win/s":>9} {"p50":>7} {"p99":>7} {"batch":>6}  SLO  shapes')
+    for max_wait in args.max_waits:
+        for rate in args.rates:
+            with batching.BatchScheduler(score, args.max_batch, max_wait / 1000) as scheduler:
+                lat, elapsed = run_load(scheduler, rate, args)
+                stats = scheduler.stats()
+            windows = sum(scheduler.batch_sizes)
+            p99 = np.percentile(lat, 99)
+            print(
+                f'{rate:7.0f} {max_wait:5.1f} {len(lat) / elapsed:8.1f} {windows / elapsed:9.0f}'
+                f' {np.percentile(lat, 50):7.1f} {p99:7.1f} {stats["mean_batch"]:6.1f}'
+                f'  {"ok " if p99 <= args.slo else "MISS"} {len(stats["shapes"])}'
+            )
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Memory held by a mapped document as a list of Word objects against
+a columnar dataset.Document, per million tokens.
+    python scripts/bench_document.py -n 1000000
+'''
+
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+from utils import dataset
+
+
+def make_tokens(n, n_surfaces, n_lemmas, n_pos):
+    '''
+    Random mapped tokens, a tenth of them with two lemmas and POS.
+    '''
+    rnd = random.Random(0)
+    for _ in range(n):
+        k = 2 if rnd.random() < 0.1 else 1
+        yield (
+            rnd.randrange(n_surfaces),
+            {rnd.randrange(n_lemmas) for _ in range(k)},
+            {rnd.randrange(n_pos) for _ in range(k)}
+        )
+
+
+def measure(name, build, n):
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:>10}: {size / n * 1e6 / 2**20:10.1f} MiB per million tokens')
+    del obj
+    return size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=1000000, help='Number of tokens')
+    args = parser.parse_args()
+
+    tokens = list(make_tokens(args.n, 200000, 100000, 13))
+
+    def build_words():
+        return [
+            dataset.Word(surface=s, lemmas=set(l), pos=set(p))
+            for s, l, p in tokens
+        ]
+
+    def build_document():
+        doc = dataset.Document()
+        for s, l, p in tokens:
+            doc.append(s, l, p)
+        return doc
+
+    words = measure('Word list', build_words, args.n)
+    columns = measure('Document', build_document, args.n)
+    print(f'Document uses {columns / words:.1%} of the memory')
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+CPU throughput of the error detection network in windows/sec for
+batch sizes 1 to 1024, per recurrent backend. Weights are random, only
+the shapes matter.
+    python scripts/bench_lstm.py -b cpu fused -r 10 -d 300 -s 512
+'''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import numpy as np
+import tensorflow as tf
+
+from err_detect_model import BaseModel
+
+BATCH_SIZES = [2**i for i in range(11)]
+
+
+def bench_backend(backend, args):
+    winsize = 2 * args.window_radius + 1
+    tf.reset_default_graph()
+    model = BaseModel(
+        args.vocab_size,
+        1,
+        1,
+        winsize,
+        args.embed_dim,
+        args.lstm_size,
+        50,
+        0.0,
+        rnn_backend=backend
+    )
+    windows = tf.placeholder(tf.int64, shape=[None, winsize])
+    logits = tf.make_template('network', model.network_template)(windows)
+    config = tf.ConfigProto(device_count={'GPU': 0})
+    with tf.Session(config=config) as sess:
+        sess.run(tf.global_variables_initializer())
+        for bsize in BATCH_SIZES:
+            batch = np.random.randint(args.vocab_size, size=(bsize, winsize))
+            sess.run(logits, feed_dict={windows: batch})
+            n = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < args.seconds:
+                sess.run(logits, feed_dict={windows: batch})
+                n += bsize
+            wps = n / (time.perf_counter() - start)
+            print(f'{backend:>6} batch {bsize:>5}: {wps:12.1f} windows/sec')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--backends', nargs='+', default=['cpu', 'fused'], help='Backends to compare')
+    parser.add_argument('-r', '--window_radius', type=int, default=10, help='Radius of the context window')
+    parser.add_argument('-d', '--embed_dim', type=int, default=300, help='Embedding size')
+    parser.add_argument('-s', '--lstm_size', type=int, default=512, help='LSTM hidden size')
+    parser.add_argument('-v', '--vocab_size', type=int, default=100000, help='Input vocabulary size')
+    parser.add_argument('-t', '--seconds', type=float, default=2.0, help='Time spent per batch size')
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        bench_backend(backend, args)
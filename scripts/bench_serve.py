@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Load test for the scoring server (run_err_detect_pt.py serve). Sends
+the lines of a text file as separate requests from `concurrency`
+clients, each waiting for its answer before sending the next, and
+reports throughput, client-side latency percentiles and the server's
+own /metrics.
+    python scripts/bench_serve.py sentences.txt -c 16 -n 2000
+'''
+
+import json
+import time
+import asyncio
+import argparse
+import itertools
+
+import numpy as np
+
+
+async def request(reader, writer, method, path, payload=None):
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\n'
+        'Content-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1')
+        + body
+    )
+    await writer.drain()
+    status = (await reader.readline()).decode('latin-1').split(' ', 2)[1]
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        key, value = line.decode('latin-1').split(':', 1)
+        if key.strip().lower() == 'content-length':
+            length = int(value)
+    data = await reader.readexactly(length)
+    return int(status), json.loads(data.decode('utf-8'))
+
+
+async def client(host, port, texts, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for text in texts:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, 'POST', '/score', {'text': text})
+            if status != 200:
+                print(f'Request failed with {status}')
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run(args, lines):
+    texts = itertools.islice(itertools.cycle(lines), args.requests)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(args.host, args.port, texts, latencies)
+        for _ in range(args.concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    lat = np.array(latencies) * 1000
+    print(f'{len(lat)} requests in {elapsed:.1f}s: {len(lat) / elapsed:.1f} req/sec')
+    for p in [50, 90, 99]:
+        print(f'p{p}: {np.percentile(lat, p):.1f} ms')
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, metrics = await request(reader, writer, 'GET', '/metrics')
+    writer.close()
+    print('Server:', json.dumps(metrics))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('text_file', help='One request per line')
+    parser.add_argument('--host', default='localhost', help='Server host')
+    parser.add_argument('-p', '--port', type=int, default=5010, help='Server port')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('-n', '--requests', type=int, default=1000, help='Total requests')
+    args = parser.parse_args()
+
+    with open(args.text_file, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    asyncio.get_event_loop().run_until_complete(run(args, lines))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Throughput of the Finnish tokenizer, one JVM round trip per sentence
+(tokenize) against batched calls (tokenize_many).
+    python scripts/bench_tokenizer.py corpus.txt -n 2000 -b 256
+'''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+from tokenizer.fi_tokenizer import FinnishTokenizer
+
+
+def read_docs(fname, n):
+    docs = []
+    with open(fname, 'r', encoding='utf-8', errors='ignore') as f:
+        for doc in filter(bool, f):
+            docs.append(doc)
+            if len(docs) >= n:
+                break
+    return docs
+
+
+def report(name, docs, tokenized, elapsed):
+    ntokens = sum(len(s) for doc in tokenized for s in doc)
+    print(
+        f'{name:>14}: {len(docs) / elapsed:10.1f} docs/sec, '
+        f'{ntokens / elapsed:12.1f} tokens/sec ({elapsed:.3f}s)'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', metavar='PATH', type=str, help='One document per line')
+    parser.add_argument('-n', type=int, default=2000, help='Number of documents')
+    parser.add_argument('-b', '--batch-size', type=int, default=256, help='Documents per batch')
+    args = parser.parse_args()
+
+    docs = read_docs(args.path, args.n)
+    tokenizer = FinnishTokenizer()
+    if tokenizer.local:
+        print('Warning: running the local fallback, not the JVM tokenizer')
+
+    start = time.perf_counter()
+    single = [tokenizer.tokenize(doc) for doc in docs]
+    report('per-document', docs, single, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batched = []
+    for i in range(0, len(docs), args.batch_size):
+        batched.extend(tokenizer.tokenize_many(docs[i:i + args.batch_size]))
+    report('batched', docs, batched, time.perf_counter() - start)
+
+    same = sum(a == b for a, b in zip(single, batched))
+    print(f'{same}/{len(docs)} documents tokenized identically')
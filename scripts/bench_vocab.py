@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Throughput of vocabulary updates from many processes: every add()
+going through the VocabManager proxy against worker-local DeltaVocabs
+merged at the end.
+    python scripts/bench_vocab.py -p 8 16 32 -n 20000
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import multiprocessing as mp
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+from utils import vocab
+
+base = None
+shared = None
+
+
+def make_words(n_types):
+    rnd = random.Random(0)
+    letters = 'абвгдежзийклмнопрстуфхцчшщыэюя'
+    return list(dict.fromkeys(
+        ''.join(rnd.choice(letters) for _ in range(rnd.randint(3, 12)))
+        for _ in range(n_types)
+    ))
+
+
+def make_stream(words, n, seed):
+    '''
+    Zipf-like token stream over `words`.
+    '''
+    rnd = random.Random(seed)
+    weights = [1 / (r + 1) for r in range(len(words))]
+    return rnd.choices(words, weights, k=n)
+
+
+def proxy_worker(tokens):
+    for token in tokens:
+        shared.add(token)
+
+
+def delta_worker(tokens):
+    dv = vocab.DeltaVocab(base)
+    for token in tokens:
+        dv.add(token)
+    return dv.delta()
+
+
+def run(name, fun, streams):
+    start = time.perf_counter()
+    with mp.get_context('fork').Pool(len(streams)) as pool:
+        results = pool.map(fun, streams)
+    if name == 'delta':
+        vo = vocab.Vocab(True)
+        for word in base:
+            vo.add(word)
+        vocab.merge_deltas(vo, results)
+    elapsed = time.perf_counter() - start
+    n = sum(len(s) for s in streams)
+    print(f'{name:>6} x{len(streams):<3}: {n / elapsed:12.1f} adds/sec ({elapsed:.3f}s)')
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', type=int, nargs='+', default=[8, 16, 32], help='Process counts')
+    parser.add_argument('-n', type=int, default=20000, help='Tokens per process')
+    parser.add_argument('-t', type=int, default=100000, help='Word types')
+    args = parser.parse_args()
+
+    words = make_words(args.t)
+    # Half of the types are known in advance
+    base = vocab.Vocab(True)
+    for word in words[::2]:
+        base.add(word)
+
+    manager = vocab.VocabManager()
+    manager.start()
+    for n_procs in args.p:
+        streams = [make_stream(words, args.n, i) for i in range(n_procs)]
+        shared = manager.Vocab(True)
+        for word in base:
+            shared.add(word)
+        proxy = run('proxy', proxy_worker, streams)
+        delta = run('delta', delta_worker, streams)
+        print(f'{"":>11} delta is {proxy / delta:.1f}x faster')
+    manager.shutdown()
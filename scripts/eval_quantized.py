@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Calibrate a quantised model against its float version on held-out
+windows and compare the two: accuracy, agreement, size and CPU
+windows/sec.
+
+The first --calibration share of the windows sets the decision
+threshold of the quantised model so that it flags as many windows as
+the float model does at 0.5 (utils.quantize.calibrate_threshold); the
+rest is used for the report. For TensorFlow the threshold is written
+to the quantised export's meta.json and used by FrozenModel.predict,
+for PyTorch to quantize.json in the run directory, which the server
+reads when serving with the same --quantize mode.
+    python scripts/eval_quantized.py tf RUN/export RUN/export-int8 -i valid.tfrecord
+    python scripts/eval_quantized.py pt RUN_NAME -q int8 -i valid.tfrecord
+'''
+
+import io
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import numpy as np
+
+from utils import quantize as quant
+
+
+def read_windows(pattern, limit):
+    '''
+    Windows and labels of the first `limit` records of the TFRecord
+    files matching `pattern`.
+    '''
+    import tensorflow as tf
+    windows = []
+    labels = []
+    for fname in sorted(glob.glob(pattern)):
+        for record in tf.python_io.tf_record_iterator(fname):
+            feature = tf.train.Example.FromString(record).features.feature
+            windows.append(feature['sent'].int64_list.value)
+            labels.append(feature['label'].int64_list.value[0])
+            if len(windows) >= limit:
+                return np.array(windows), np.array(labels)
+    return np.array(windows), np.array(labels)
+
+
+def score_all(score, windows, bsize):
+    '''
+    Scores of `windows` in batches of exactly `bsize`, so that both
+    models see the same batches (the TF LSTM runs along the batch axis).
+    '''
+    return np.concatenate([
+        score(windows[i:i + bsize])
+        for i in range(0, len(windows), bsize)
+    ])
+
+
+def throughput(score, windows, bsize, seconds):
+    batch = windows[:bsize]
+    score(batch)
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        score(batch)
+        n += len(batch)
+    return n / (time.perf_counter() - start)
+
+
+def tf_models(args):
+    from err_detect_model.export import FrozenModel, GRAPH_FILE
+    ref = FrozenModel(args.models[0], args.threads)
+    model = FrozenModel(args.models[1], args.threads)
+    sizes = [
+        os.path.getsize(os.path.join(d, GRAPH_FILE))
+        for d in args.models
+    ]
+
+    def save_threshold(threshold):
+        meta_file = os.path.join(args.models[1], 'meta.json')
+        model.meta['threshold'] = threshold
+        with open(meta_file, 'w') as f:
+            json.dump(model.meta, f, indent=2)
+        return meta_file
+    return ref, model, sizes, save_threshold
+
+
+def pt_models(args):
+    import torch
+    from err_detect_pt import cfg
+    from err_detect_pt.server import Scorer, QUANTIZE_FILE
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    ref = Scorer.from_run(args.models[0], force_cpu=True)
+    model = ref.quantized(args.quantize)
+
+    def size(scorer):
+        buf = io.BytesIO()
+        torch.save(scorer.net.state_dict(), buf)
+        return buf.tell() + scorer.embeddings.nbytes
+
+    def save_threshold(threshold):
+        fname = os.path.join(cfg.run_dir, args.models[0], QUANTIZE_FILE)
+        calibrated = {}
+        if os.path.isfile(fname):
+            with open(fname, 'r') as f:
+                calibrated = json.load(f)
+        calibrated[args.quantize] = threshold
+        with open(fname, 'w') as f:
+            json.dump(calibrated, f, indent=2)
+        return fname
+    return ref, model, [size(ref), size(model)], save_threshold
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('backend', choices=['tf', 'pt'], help='Model implementation')
+    parser.add_argument('models', nargs='+', help='tf: float and quantised export dirs; pt: run path')
+    parser.add_argument('-i', '--input_file', required=True, help='Held-out TFRecord file(s), globs allowed')
+    parser.add_argument('-q', '--quantize', choices=quant.MODES[1:], default='int8', help='pt: quantisation mode')
+    parser.add_argument('-n', '--max_windows', type=int, default=100000, help='Windows to read')
+    parser.add_argument('-c', '--calibration', type=float, default=0.2, help='Share of windows used for calibration')
+    parser.add_argument('-b', '--batch_size', type=int, default=256, help='Windows per call')
+    parser.add_argument('-t', '--threads', type=int, default=0, help='CPU threads (default: framework decides)')
+    parser.add_argument('-s', '--seconds', type=float, default=5.0, help='Duration of each throughput test')
+    args = parser.parse_args()
+
+    windows, labels = read_windows(args.input_file, args.max_windows)
+    # Whole batches only, a short last batch would be scored in another
+    # context than the others
+    n = len(windows) // args.batch_size * args.batch_size
+    if not n:
+        sys.exit(f'Fewer than {args.batch_size} held-out windows')
+    windows, labels = windows[:n], labels[:n]
+    print(f'{len(windows)} held-out windows')
+    if args.backend == 'tf':
+        ref, model, sizes, save_threshold = tf_models(args)
+    else:
+        ref, model, sizes, save_threshold = pt_models(args)
+
+    ref_probs = score_all(ref, windows, args.batch_size)
+    probs = score_all(model, windows, args.batch_size)
+    n_calib = int(len(windows) * args.calibration)
+    threshold = quant.calibrate_threshold(ref_probs[:n_calib], probs[:n_calib])
+    print(f'Calibrated threshold {threshold:.4f}, saved to {save_threshold(threshold)}')
+
+    ref_probs, probs, labels = ref_probs[n_calib:], probs[n_calib:], labels[n_calib:]
+    ref_pred = ref_probs >= 0.5
+    pred = probs >= threshold
+    speeds = [
+        throughput(m, windows, args.batch_size, args.seconds)
+        for m in (ref, model)
+    ]
+    print(f'{"":<18} {"float":>12} {"quantised":>12}')
+    print(f'{"accuracy":<18} {np.mean(ref_pred == labels):12.4f} {np.mean(pred == labels):12.4f}')
+    print(f'{"acc. at 0.5":<18} {"":>12} {np.mean((probs >= 0.5) == labels):12.4f}')
+    print(f'{"agreement":<18} {"":>12} {np.mean(pred == ref_pred):12.4f}')
+    print(f'{"mean |dp|":<18} {"":>12} {np.mean(np.abs(probs - ref_probs)):12.5f}')
+    print(f'{"size MiB":<18} {sizes[0] / 2**20:12.1f} {sizes[1] / 2**20:12.1f}')
+    print(f'{"windows/sec":<18} {speeds[0]:12.1f} {speeds[1]:12.1f}')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Load a graph exported with `run_er_detect.py export` and report the
+startup time, resident memory and CPU throughput.
+    python scripts/load_frozen.py /path/to/run/export -b 256 -t 4
+'''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import numpy as np
+
+from utils import utils
+
+
+def report(stage, seconds):
+    rss, peak = utils.memory_usage()
+    print(f'{stage:<12} {seconds:7.2f}s  rss {rss:8.1f} MiB  peak {peak:8.1f} MiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('export_dir', help='Directory with model.pb and meta.json')
+    parser.add_argument('-b', '--batch_size', type=int, default=256, help='Windows per call')
+    parser.add_argument('-t', '--threads', type=int, default=0, help='Intra-op threads (default: TensorFlow decides)')
+    parser.add_argument('-s', '--seconds', type=float, default=5.0, help='Duration of the throughput test')
+    args = parser.parse_args()
+
+    report('start', 0)
+    start = time.perf_counter()
+    import tensorflow as tf  # noqa: F401
+    from err_detect_model.export import FrozenModel
+    report('import', time.perf_counter() - start)
+
+    model = FrozenModel(args.export_dir, args.threads)
+    report('load', model.load_time)
+
+    meta = model.meta
+    batch = np.random.randint(meta['vocab_size'], size=(args.batch_size, meta['winsize']))
+    start = time.perf_counter()
+    model(batch)
+    report('first call', time.perf_counter() - start)
+
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.seconds:
+        model(batch)
+        n += len(batch)
+    elapsed = time.perf_counter() - start
+    report('steady', elapsed)
+    print(f'{n / elapsed:.1f} windows/sec at batch size {args.batch_size}')
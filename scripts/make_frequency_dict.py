@@ -2,14 +2,22 @@
 # -*- coding: utf-8 -*-
 
 
-import sys, os, re, pickle, argparse, string
-import numpy as np
-import subprocess as sp
+import sys, os, re, argparse, string, itertools
 import multiprocessing as mp
-from multiprocessing.managers import BaseManager, NamespaceProxy
-from collections import OrderedDict
-from disambiguation import *
 
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+from tokenizer.fi_tokenizer import FinnishTokenizer, get_gateway
+from utils import freq
+from utils import progress
+
+# Documents sent to the tokenizer JVM per call
+batch_size = 256
 
 
 def filter_word(word):
@@ -26,118 +34,103 @@ def filter_word(word):
     
 '''
 Split an input text into tokens using OpenNLP
-and tidy up the result a bit.
+and tidy up the result a bit. Every worker talks to the
+same tokenizer JVM, see initializer(). The counts are spilled
+to sorted run files, the list of which is returned.
 '''
 def tokenize_task(input_file):
-
-    dictionary = {}
-    
-    print("*****input file")
-    print(input_file)
+    run_prefix = os.path.join(run_dir, os.path.basename(input_file))
+    counter = freq.StreamingCounter(
+        run_prefix,
+        max_entries=max_entries,
+        tail=tail,
+        sketch=freq.CountMinSketch() if tail else None
+    )
     with open(input_file, 'r') as f:
-        onlp = os.path.join(resources, 'apache-opennlp-1.8.2/bin/opennlp')
-        smodel = os.path.join(resources, 'token-models/fi-sent.bin')
-        tmodel = os.path.join(resources, 'token-models/fi-token.bin')
-        sproc = sp.run(
-            [onlp, 'SentenceDetector', smodel],
-            stdout = sp.PIPE,
-            stderr = sp.DEVNULL,
-            stdin = f
-        )
-        tproc = sp.run(
-            [onlp, 'TokenizerME', tmodel],
-            stdout = sp.PIPE,
-            stderr = sp.DEVNULL,
-            input = sproc.stdout
-        )
-        text = str(tproc.stdout, 'utf-8')
-        pattern = r'(--|»|\||\#)'
-        text = re.sub(re.compile(pattern), '', text)
-        pattern = r'\n+'
-        text = re.sub(re.compile(pattern), '\n', text)
-        sents = text.split('\n')
-        words = []
-        for s in filter(bool, sents):
-            # words.append(list(filter(bool, s.split(' '))))
-            for w in filter(bool, s.split(' ')):
-                word = filter_word(w)
-                if word:
-                    dictionary[word] = dictionary.get(word, 0) + 1
-                else:
-                    continue
+        docs = filter(bool, f)
+        while True:
+            batch = list(itertools.islice(docs, batch_size))
+            if not batch:
+                break
+            for doc in tokenizer.tokenize_many(batch):
+                for s in doc:
+                    for w in s:
+                        word = filter_word(w)
+                        if word:
+                            counter.add(word)
+    runs = counter.close()
+    if counter.sketch is not None:
+        sketch_file = run_prefix + '.cms.npy'
+        counter.sketch.save(sketch_file)
+    else:
+        sketch_file = None
+    progress.multip(count, total, 0)
+    return runs, sketch_file
 
-        progress_multip(count, total)
-    return dictionary
 
+def initializer(local):
+    global tokenizer
+    tokenizer = FinnishTokenizer(local=local)
 
-def initializer():
-    global dictionary
-    dictionary = dict()
 
-def make_freq_dict(file_list):
+def make_freq_dict(file_list, output_file, min_count=1):
+    '''
+    Count the words of all files in `file_list` and write them to
+    `output_file` as a freq.FreqTable.
+    '''
     global count
     count = mp.Value('I', 0)
-    pool = mp.Pool(processes = os.cpu_count())
-    tokens = pool.map(tokenize_task, file_list)
+    # Launch the JVM once, the workers connect to it. Without one they
+    # all tokenize with NLTK instead of each trying to launch it.
+    local = get_gateway() is None
+    if local:
+        print('Tokenizing with NLTK')
+    pool = mp.Pool(processes = os.cpu_count(), initializer = initializer, initargs = (local,))
+    results = pool.map(tokenize_task, file_list)
     pool.close()
     pool.join()
-    freq_dict = dict()
-    print('Creating a word frequency dict')
-    for t in tokens:
-        print(t)
-        for s in t:
-            for w in s:
-                word = filter_word(w)
-                if word:
-                    freq_dict[word] = freq_dict.get(word, 0) + 1
-                else:
-                    continue
-    d = OrderedDict(sorted(freq_dict.items(), key=lambda t: int(t[1]), reverse=True))
-    del tokens                
-    return d
-
-
-
-def make_freq_dict(dict_list):
-    global count
-    count = mp.Value('I', 0)
-    pool = mp.Pool(processes = os.cpu_count())
-    dictionaries = pool.map(tokenize_task, file_list)
-    pool.close()
-    pool.join()
-    freq_dict = dict()
-    print('Creating a word frequency dict')
-    for d in dictionaries:
-        #print(t)
-        for word, count in d.items():
-            word = filter_word(word)
-            if word:
-                freq_dict[word] = freq_dict.get(word, 0) + count
+    print()
+    print('Merging word counts')
+    runs = [run for rs, _ in results for run in rs]
+    sketch = None
+    for _, sketch_file in results:
+        if sketch_file:
+            part = freq.CountMinSketch.load(sketch_file)
+            if sketch is None:
+                sketch = part
             else:
-                continue
-    d = OrderedDict(sorted(freq_dict.items(), key=lambda t: int(t[1]), reverse=True))
-    return d
-
-
-
+                sketch.merge(part)
+            os.remove(sketch_file)
+    freq.write_table(freq.merge_runs(runs), output_file, min_count, sketch)
+    for run in runs:
+        os.remove(run)
+    return freq.FreqTable(output_file)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('path', metavar = 'PATH', type=str, help = 'Path to the source text')
+    parser.add_argument('-o', '--output', type=str, default='frequency_table', help='Frequency table to write')
+    parser.add_argument('--max-entries', type=int, default=1000000, help='Words counted in memory per worker before spilling')
+    parser.add_argument('--tail', type=int, default=0, help='Keep words seen at most this many times per spill in a count-min sketch')
+    parser.add_argument('--min-count', type=int, default=1, help='Leave rarer words out of the table')
+    parser.add_argument('--from-json', action='store_true', help='PATH is a JSON frequency dict to convert')
     args = parser.parse_args()
     print(args.path)
 
-    total = len(os.listdir(args.path))
-    texts = os.scandir(args.path)
-    file_list = (t.path for t in texts)
-
-    freq_dict = make_freq_dict(file_list)
-    # print(freq_dict)
-    print('Frequency dict is created, {} items'.format(len(freq_dict)))
-    print('Loading data')
-    with open('frequency_table.pck', 'wb') as f:
-        pickle.dump(freq_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
-        
-
-    
+    if args.from_json:
+        freq_dict = freq.load(args.path)
+        freq.write_table(freq_dict.items(), args.output, args.min_count)
+    else:
+        max_entries = args.max_entries
+        tail = args.tail
+        run_dir = args.output + '.runs'
+        os.makedirs(run_dir, exist_ok=True)
+        total = len(os.listdir(args.path))
+        texts = os.scandir(args.path)
+        file_list = [t.path for t in texts]
+        make_freq_dict(file_list, args.output, args.min_count)
+        os.rmdir(run_dir)
+    # What was written, i.e. after --min-count
+    table = freq.FreqTable(args.output)
+    print('Frequency table is created, {} word types, {} tokens'.format(len(table), sum(table.counts)))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Map a vocabulary to pretrained vectors, see utils.embeddings. The
+source is a fastText .bin model (unknown words get subword vectors) or
+a word2vec/fastText/GloVe text file (parsed by `--workers` processes).
+The output is a float32 .npy matrix for run_er_detect.py --pretrained.
+    python scripts/map_embeddings.py surfaces.txt cc.ru.300.vec pretrained_300.npy -w 16
+'''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+from utils import embeddings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vocab_file', help='Vocabulary, one word per line in ID order')
+    parser.add_argument('src_file', help='fastText .bin model or text vector file')
+    parser.add_argument('output', help='Output .npy file')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Processes parsing text files (default: all CPUs)')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Seed for the random vectors')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    embeddings.map_vectors(args.src_file, args.vocab_file, args.output, args.workers, args.seed)
+    print(f'Done in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Prune the surface vocabulary to its frequent words and compact the
+embedding matrix to match.
+
+Writes to OUT_DIR:
+    surfaces.txt  the pruned vocabulary
+    remap.npy     old -> new ID of every word, dropped words map to unk
+    <embeddings>  the rows of the kept words, if --embeddings is given
+
+Existing TFRecord files keep working: train with --remap OUT_DIR/remap.npy
+and --pretrained OUT_DIR/<embeddings>, the IDs are mapped as they are
+read. Prints the vocabulary, token coverage and embedding sizes before
+and after, and with --measure the load time and memory of both
+matrices.
+    python scripts/prune_vocab.py surfaces.txt freq.table out/ -m 2 -e pretrained_300.npy --measure
+'''
+
+import os
+import sys
+import argparse
+import subprocess
+
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+import numpy as np
+
+from utils import freq
+from utils import vocab
+
+
+def compact_embeddings(in_file, out_file, keep, chunk=65536):
+    '''
+    Rows `keep` of the .npy matrix `in_file`, copied a chunk at a time
+    so neither matrix is ever fully in memory.
+    '''
+    src = np.load(in_file, mmap_mode='r')
+    dst = np.lib.format.open_memmap(
+        out_file,
+        mode='w+',
+        dtype=src.dtype,
+        shape=(len(keep), src.shape[1])
+    )
+    for start in range(0, len(keep), chunk):
+        dst[start:start + chunk] = src[keep[start:start + chunk]]
+    dst.flush()
+    del dst
+
+
+def measure_load(emb_file):
+    '''
+    Seconds and peak MiB a fresh process needs to np.load `emb_file`,
+    as run_er_detect.load_pretrained does.
+    '''
+    # ru_maxrss survives fork and exec, the VmHWM of the new process
+    # does not
+    code = (
+        'import time, numpy as np\n'
+        'start = time.perf_counter()\n'
+        f'm = np.float32(np.load({emb_file!r}))\n'
+        'elapsed = time.perf_counter() - start\n'
+        'status = open(\'/proc/self/status\').read().split(\'VmHWM:\')[1]\n'
+        'print(elapsed, int(status.split()[0]) / 1024)'
+    )
+    out = subprocess.run(
+        [sys.executable, '-c', code],
+        stdout=subprocess.PIPE,
+        check=True,
+        encoding='utf-8'
+    ).stdout
+    elapsed, peak = out.split()
+    return float(elapsed), float(peak)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vocab_file', help='Surface vocabulary (surfaces.txt)')
+    parser.add_argument('freq_file', help='Frequency table or JSON from make_frequency_dict.py')
+    parser.add_argument('output_dir', help='Directory for the pruned files')
+    parser.add_argument('-m', '--min_count', type=int, default=2, help='Drop words seen fewer times (default: 2, as DocMapper maps words seen once to unk)')
+    parser.add_argument('-c', '--coverage', type=float, default=None, help='Keep the most frequent words covering this share of tokens')
+    parser.add_argument('-s', '--max_size', type=int, default=None, help='Largest vocabulary size, special labels included')
+    parser.add_argument('-e', '--embeddings', default=None, help='Embedding matrix (.npy) to compact')
+    parser.add_argument('--measure', action='store_true', help='Time loading the full and the compacted embeddings')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    print('Loading vocabulary and frequencies...')
+    surf_vocab = vocab.Vocab.load(args.vocab_file, None)
+    freq_dict = freq.load(args.freq_file)
+    words = [surf_vocab.index2word[i] for i in range(len(surf_vocab))]
+    counts = [freq_dict.get(word, 0) for word in words]
+
+    remap = np.array(
+        vocab.prune_map(counts, args.min_count, args.coverage, args.max_size),
+        dtype=np.int32
+    )
+    n_special = len(vocab.special_labels)
+    # Specials and the words that keep their own ID, in old ID order
+    keep = np.flatnonzero(
+        (np.arange(len(remap)) < n_special)
+        | (remap != remap[surf_vocab[vocab.unknown_label]])
+    )
+    with open(os.path.join(args.output_dir, 'surfaces.txt'), 'w') as f:
+        for i in keep:
+            print(words[i], file=f)
+    np.save(os.path.join(args.output_dir, 'remap.npy'), remap)
+
+    counts = np.array(counts, dtype=np.int64)
+    total = counts[n_special:].sum()
+    kept = counts[keep[keep >= n_special]].sum()
+    print(f'Vocabulary: {len(remap)} -> {len(keep)} words ({len(keep) / len(remap):.1%})')
+    if total:
+        print(f'Token coverage: {kept / total:.2%} of {total} tokens')
+
+    if args.embeddings:
+        out_file = os.path.join(args.output_dir, os.path.basename(args.embeddings))
+        print('Compacting embeddings...')
+        compact_embeddings(args.embeddings, out_file, keep)
+        sizes = [os.path.getsize(f) / 2**20 for f in (args.embeddings, out_file)]
+        print(f'Embeddings: {sizes[0]:.1f} MiB -> {sizes[1]:.1f} MiB')
+        if args.measure:
+            before = measure_load(args.embeddings)
+            after = measure_load(out_file)
+            print(f'Load time: {before[0]:.2f}s -> {after[0]:.2f}s')
+            print(f'Peak memory: {before[1]:.1f} MiB -> {after[1]:.1f} MiB')
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import os
+import sys
+import types
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ANALYSER_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'analyser'
+)
+
+
+def stub_module(name):
+    '''
+    Register an empty module under `name` unless it can be imported.
+    '''
+    if name in sys.modules:
+        return
+    if '.' in name:
+        module = name.rsplit('.', 1)[1]
+        if os.path.exists(os.path.join(ANALYSER_DIR, module + '.py')):
+            return
+    elif importlib.util.find_spec(name) is not None:
+        return
+    sys.modules[name] = types.ModuleType(name)
+
+
+# The language configs and rules are not part of the repository, and the
+# analyser package imports every analyser. Load analyzer_base on its own
+# and take the stand-ins out again, so other tests import the real package.
+loaded = set(sys.modules)
+if not os.path.exists(os.path.join(ANALYSER_DIR, 'analyzers_config.py')):
+    package = types.ModuleType('analyser')
+    package.__path__ = [ANALYSER_DIR]
+    sys.modules.setdefault('analyser', package)
+for name in ['libhfst', 'rules', 'analyser.analyzers_config',
+             'analyser.pre_analyze_config', 'analyser.data_to_filter']:
+    stub_module(name)
+
+from analyser.analyzer_base import BaseAnalyzer
+
+for name in set(sys.modules) - loaded:
+    if name == 'analyser' or name.startswith('analyser.') or name == 'rules':
+        del sys.modules[name]
+
+
+class RuleAnalyser(BaseAnalyzer):
+    '''
+    BaseAnalyzer returning fixed readings, to test post_analyzer alone.
+    '''
+    def __init__(self, readings, gov_rules):
+        self.language = 'Russian'
+        self.readings = readings
+        self.profile = types.SimpleNamespace(gov_rules=gov_rules, gov_variants={})
+
+    def process_non_analyzable(self, token, token_dict):
+        return token_dict
+
+    def to_dict(self, analyses, word):
+        return {'analyses': {self.language: list(self.readings)}}
+
+    def format_sort(self, result, **kwargs):
+        return result
+
+
+def reading(base, pos):
+    return [{'base': base, 'pos': pos, 'tags': {'CASE': 'Nom'}}]
+
+
+def test_government_variants():
+    an = RuleAnalyser(
+        [reading('ждать', 'Verb'), reading('дом', 'Noun')],
+        {('ждать', 'Verb'): ('Acc', 'Gen')}
+    )
+    result = an.post_analyzer(None, 'ждать')['analyses']['Russian']
+    assert result[0] == reading('дом', 'Noun')
+    assert [r[0]['tags']['GOV_CASE'] for r in result[1:]] == ['Acc', 'Gen']
+
+
+def test_government_rule_without_cases():
+    # A rule with no governed cases drops the reading instead of keeping it
+    an = RuleAnalyser(
+        [reading('ждать', 'Verb'), reading('дом', 'Noun')],
+        {('ждать', 'Verb'): ()}
+    )
+    result = an.post_analyzer(None, 'ждать')['analyses']['Russian']
+    assert result == [reading('дом', 'Noun')]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tokenizer.fi_tokenizer import FinnishTokenizer, SENT_MARK
+
+
+class FakeDetector:
+    '''
+    SentenceDetectorME stand-in splitting after full stops and newlines.
+    '''
+    def sentDetect(self, text):
+        return [s.strip() for s in re.split(r'(?<=\.)\s+|\n', text) if s.strip()]
+
+
+class FakeTokenizer:
+    '''
+    TokenizerME stand-in splitting at whitespace, optionally dropping
+    sentence marks.
+    '''
+    def __init__(self, drop_marks=False):
+        self.drop_marks = drop_marks
+
+    def tokenize(self, text):
+        tokens = text.split()
+        if self.drop_marks:
+            tokens = [t for t in tokens if t != SENT_MARK]
+        return tokens
+
+
+def make_tokenizer(tok):
+    tokenizer = FinnishTokenizer(local=True)
+    tokenizer.local = False
+    tokenizer.sdet = FakeDetector()
+    tokenizer.tok = tok
+    tokenizer.join = lambda sep, items: sep.join(items)
+    return tokenizer
+
+
+DOCS = [
+    'Talo on iso. Se on punainen.',
+    '',
+    '-- . Koira haukkuu\nKissa ei.',
+    f'Yksi{SENT_MARK} lause.'
+]
+
+
+def test_tokenize_many_matches_tokenize():
+    tokenizer = make_tokenizer(FakeTokenizer())
+    expected = [tokenizer.tokenize(doc) for doc in DOCS]
+    assert tokenizer.tokenize_many(DOCS) == expected
+
+
+def test_tokenize_many_redoes_documents_with_lost_marks():
+    tokenizer = make_tokenizer(FakeTokenizer(drop_marks=True))
+    expected = [tokenizer.tokenize(doc) for doc in DOCS]
+    assert tokenizer.tokenize_many(DOCS) == expected
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import freq
+from utils import vocab
+
+
+def test_table_from_merged_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(freq, 'COUNTS_CHUNK', 2)
+    runs = []
+    for i, words in enumerate([['talo', 'koira', 'talo'], ['öljy', 'talo', 'kissa']]):
+        counter = freq.StreamingCounter(str(tmp_path / f'run{i}'), max_entries=2)
+        counter.update(words)
+        runs.extend(counter.close())
+    fname = str(tmp_path / 'table')
+    freq.write_table(freq.merge_runs(runs), fname, min_count=1)
+    table = freq.FreqTable(fname)
+    assert dict(table.items()) == {'kissa': 1, 'koira': 1, 'talo': 3, 'öljy': 1}
+    assert table['talo'] == 3
+    assert table.get('auto') is None
+
+    freq.write_table(freq.merge_runs(runs), fname, min_count=2)
+    assert dict(freq.FreqTable(fname).items()) == {'talo': 3}
+
+
+def test_frozen_vocab_keeps_first_id_of_repeated_words(tmp_path):
+    fname = str(tmp_path / 'vocab')
+    vocab.write_frozen(iter(['a', 'bb', 'a', '', 'ccc']), fname)
+    words = vocab.FrozenVocab(fname)
+    assert [words.get(w) for w in ['a', 'bb', 'ccc', 'd']] == [0, 1, 4, None]
+    assert len(words) == 5
+
+    vocab.write_frozen(iter([]), fname)
+    assert len(vocab.FrozenVocab(fname)) == 0
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import dataset
+from utils import pipeline
+from utils import vocab
+
+
+class FakeAnalyser:
+    '''
+    MemoAnalyser stand-in with fixed Finnish analyses.
+    '''
+    analyses = {
+        'talo': [[{'base': 'talo', 'pos': 'Noun'}]],
+        '—': [[{'base': '—', 'pos': 'Punct'}]],
+        '.': [[{'base': '.', 'pos': 'Punct'}]]
+    }
+
+    def analyse_many(self, words):
+        return [self.analyses.get(word, []) for word in words]
+
+
+def test_fi_make_gen_with_analyser():
+    doc = [['Talo', '—', '.'], ['talo']]
+    dm = pipeline.DocMapper(doc, FakeAnalyser(), None, 'Finnish', set(), mode='token')
+    tokens = list(dm)
+    assert [t[0].surface for t in (tokens[0], tokens[3])] == ['talo', 'talo']
+    assert tokens[1] == dataset.PUNCT
+    assert tokens[2] == dataset.PUNCT
+
+
+def test_fi_make_gen_pre_analysed():
+    doc = [{'features': [
+        {'surface': 'Talo', 'pos': 'NOUN', 'analyses': [[{'base': 'talo', 'pos': 'Noun'}]]},
+        {'surface': '»', 'pos': 'PUNCT', 'analyses': []}
+    ]}]
+    dm = pipeline.DocMapper(doc, None, None, 'Finnish', set(), mode='token')
+    tokens = list(dm)
+    assert tokens[0][0].surface == 'talo'
+    assert tokens[1] == dataset.PUNCT
+
+
+def test_map_windows():
+    vomap = dataset.VocabMap(vocab.Vocab(True, 'Finnish'), vocab.Vocab(True, 'Finnish'), 'Finnish')
+    sents = [['Talo', '—', '.'], ['talo', 'xyz']]
+    windows, positions = pipeline.map_windows(sents, FakeAnalyser(), vomap, 'Finnish', 1)
+    # xyz has no analyses and maps to no token
+    assert positions == [[0, 1, 2], [3, None]]
+    pad = vomap.surf_vocab[vocab.padding_label]
+    talo = vomap.surf_vocab['talo']
+    punct = vomap.surf_vocab[vocab.punct_label]
+    assert windows.tolist() == [
+        [pad, talo, punct],
+        [talo, punct, punct],
+        [punct, punct, talo],
+        [punct, talo, pad]
+    ]
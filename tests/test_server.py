@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+import torch
+
+from err_detect_pt import cfg
+from err_detect_pt import model
+from err_detect_pt.server import Scorer, QUANTIZE_FILE
+
+VOCAB = 50
+EMBED_DIM = 8
+WIN_RAD = 2
+
+
+def tiny_model(out_units=1):
+    return model.Model(EMBED_DIM, 6, 4, 1, 0.0, WIN_RAD, out_units)
+
+
+def windows(n):
+    return np.random.RandomState(0).randint(VOCAB, size=(n, 2 * WIN_RAD + 1))
+
+
+def test_scorer():
+    embeddings = np.random.rand(VOCAB, EMBED_DIM).astype(np.float32)
+    scorer = Scorer(tiny_model(), embeddings, torch.device('cpu'))
+    w = windows(7)
+    probs = scorer(w)
+    assert probs.shape == (7,)
+    assert ((probs > 0) & (probs < 1)).all()
+    # Every window is scored on its own
+    np.testing.assert_allclose(scorer(w[:3]), probs[:3], rtol=1e-5)
+    assert scorer.quantized('int8')(w).shape == (7,)
+
+
+def test_scorer_from_run(tmp_path, monkeypatch):
+    net = tiny_model(VOCAB)
+    run = tmp_path / 'run'
+    run.mkdir()
+    torch.save({'model': net.state_dict()}, str(run / 'best.pt'))
+    monkeypatch.setattr(cfg, 'run_dir', str(tmp_path))
+    monkeypatch.setattr(cfg, 'window_rad', WIN_RAD)
+    monkeypatch.setattr(cfg, 'embedding_file', str(tmp_path / 'embeddings.npy'))
+    with pytest.raises(FileNotFoundError):
+        Scorer.from_run('run', force_cpu=True)
+    np.save(cfg.embedding_file, np.random.rand(VOCAB, EMBED_DIM + 1).astype(np.float32))
+    with pytest.raises(ValueError):
+        Scorer.from_run('run', force_cpu=True)
+    np.save(cfg.embedding_file, np.random.rand(VOCAB, EMBED_DIM).astype(np.float32))
+    scorer = Scorer.from_run('run', force_cpu=True)
+    assert scorer(windows(5)).shape == (5,)
+
+
+def test_scorer_calibrated_threshold(tmp_path, monkeypatch):
+    net = tiny_model()
+    run = tmp_path / 'run'
+    run.mkdir()
+    torch.save({'model': net.state_dict()}, str(run / 'best.pt'))
+    (run / QUANTIZE_FILE).write_text('{"float16": 0.25}')
+    monkeypatch.setattr(cfg, 'run_dir', str(tmp_path))
+    monkeypatch.setattr(cfg, 'window_rad', WIN_RAD)
+    monkeypatch.setattr(cfg, 'embedding_file', str(tmp_path / 'embeddings.npy'))
+    np.save(cfg.embedding_file, np.random.rand(VOCAB, EMBED_DIM).astype(np.float32))
+    assert Scorer.from_run('run', force_cpu=True).threshold == 0.5
+    assert Scorer.from_run('run', force_cpu=True, quantize='float16').threshold == 0.25
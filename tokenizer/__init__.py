@@ -9,6 +9,9 @@ class BaseTokenizer(metaclass=ABCMeta):
     def tokenize(self, doc):
         pass
 
+    def tokenize_many(self, docs):
+        return [self.tokenize(doc) for doc in docs]
+
 from . import *
 
 LANG_MAP = {
@@ -29,3 +32,4 @@ class Tokenizer:
     def __init__(self, lang):
         self.backend = LANG_MAP.get(lang, GenericTokenizer)()
         self.tokenize = self.backend.tokenize
+        self.tokenize_many = self.backend.tokenize_many
@@ -7,20 +7,66 @@ import ujson
 
 from . import BaseTokenizer
 
-from py4j.java_gateway import JavaGateway
+try:
+    from py4j.java_gateway import JavaGateway, GatewayParameters
+    from py4j.protocol import Py4JNetworkError
+except ImportError:
+    JavaGateway = None
+    Py4JNetworkError = OSError
 
 ONLP_TOOLS = '/Resources/apache-opennlp-1.8.2/...'
 SENT_FILE = 'Resources/token-models/fi-sent.bin'
 TOKEN_FILE = 'Resources/token-models/fi-token.bin'
 
+# Port of a running gateway JVM. Set by the first process that launches
+# one, so that worker processes started later connect to the same JVM.
+PORT_ENV = 'FI_TOKENIZER_PORT'
+
+# Private use characters marking document and sentence boundaries in
+# batched calls. They are stripped from all input text, so that batched
+# and per-document tokenizing see the same text.
+DOC_MARK = '\ue000'
+SENT_MARK = '\ue001'
+MARKS = re.compile(f'[{DOC_MARK}{SENT_MARK}]')
+
+gateway = None
+gateway_pid = None
+
+
+def get_gateway():
+    '''
+    Return the gateway to the tokenizer JVM, connecting to the one in
+    $FI_TOKENIZER_PORT if there is one and launching it otherwise.
+    A forked process opens its own connection to the parent's JVM.
+    None if py4j is not installed or the JVM cannot be reached.
+    '''
+    global gateway, gateway_pid
+    if JavaGateway is None:
+        return None
+    if gateway is None or gateway_pid != os.getpid():
+        gateway_pid = os.getpid()
+        port = os.environ.get(PORT_ENV)
+        try:
+            if port:
+                gateway = JavaGateway(
+                    gateway_parameters=GatewayParameters(port=int(port))
+                )
+            else:
+                gateway = JavaGateway.launch_gateway(
+                    classpath=ONLP_TOOLS,
+                    die_on_exit=True
+                )
+                os.environ[PORT_ENV] = str(gateway.gateway_parameters.port)
+        except (Py4JNetworkError, OSError) as ex:
+            print('Tokenizer JVM unavailable:', ex)
+            gateway = None
+    return gateway
+
+
 class FinnishTokenizer(BaseTokenizer):
     lang = 'Finnish'
 
-    def __init__(self):
-        gateway = JavaGateway.launch_gateway(
-            classpath=ONLP_TOOLS,
-            die_on_exit=True
-        )
+    def _init_jvm(self, gateway):
         spkg = gateway.jvm.opennlp.tools.sentdetect
         tpkg = gateway.jvm.opennlp.tools.tokenize
         fis = gateway.jvm.java.io.FileInputStream
@@ -30,6 +76,30 @@ class FinnishTokenizer(BaseTokenizer):
         tfile = fis(TOKEN_FILE)
         tmodel = tpkg.TokenizerModel(tfile)
         self.tok = tpkg.TokenizerME(tmodel)
+        self.join = gateway.jvm.java.lang.String.join
+
+    def _init_local(self):
+        from nltk.tokenize import sent_tokenize, word_tokenize
+        self.sent_tokenize = sent_tokenize
+        self.word_tokenize = word_tokenize
+
+    def __init__(self, local=False):
+        '''
+        OpenNLP in the tokenizer JVM, or NLTK if `local` is set or the
+        JVM is unavailable.
+        '''
+        self.local = local
+        if not local:
+            gateway = get_gateway()
+            try:
+                if gateway is None:
+                    raise RuntimeError('no tokenizer JVM')
+                self._init_jvm(gateway)
+            except Exception as ex:
+                print('OpenNLP tokenizer unavailable, falling back to NLTK:', ex)
+                self.local = True
+        if self.local:
+            self._init_local()
 
         pattern = r'(--|»|\||\#)'
         self.bad_chars = re.compile(pattern)
@@ -51,13 +121,74 @@ class FinnishTokenizer(BaseTokenizer):
         else:
             return word
 
-    def tokenize(self, doc):
+    def _clean_text(self, doc):
         text = re.sub(self.bad_chars, '', doc)
-        text = re.sub(self.newlines, '\n', text)
+        text = MARKS.sub('', text)
+        return re.sub(self.newlines, '\n', text)
+
+    def tokenize(self, doc):
+        text = self._clean_text(doc)
+        if self.local:
+            sents = self.sent_tokenize(text)
+            tokenize = self.word_tokenize
+        else:
+            sents = self.sdet.sentDetect(text)
+            tokenize = self.tok.tokenize
         return [
             [
                 self._clean_word(token)
-                for token in self.tok.tokenize(sent)
+                for token in tokenize(sent)
             ]
-            for sent in self.sdet.sentDetect(text)
+            for sent in sents
         ]
+
+    def tokenize_many(self, docs):
+        '''
+        Tokenize a batch of documents with four JVM calls in total:
+        sentence detection and tokenization each run once over the
+        concatenated batch, and each result comes back as one string.
+        Gives the same result as tokenizing the documents one by one;
+        documents whose boundary marks the models lost are redone that way.
+        '''
+        if self.local or not docs:
+            return [self.tokenize(doc) for doc in docs]
+        texts = [self._clean_text(doc) for doc in docs]
+        batch = f'\n{DOC_MARK}\n'.join(texts)
+        sents = self.join(SENT_MARK, self.sdet.sentDetect(batch))
+        # Split sentences at document boundaries
+        doc_sents = [[]]
+        for sent in sents.split(SENT_MARK):
+            pieces = sent.split(DOC_MARK)
+            for i, piece in enumerate(pieces):
+                if i > 0:
+                    doc_sents.append([])
+                piece = piece.strip()
+                if piece:
+                    doc_sents[-1].append(piece)
+        if len(doc_sents) != len(docs):
+            return [self.tokenize(doc) for doc in docs]
+        # Tokenize every sentence of the batch in one call. Tokens never
+        # contain whitespace, so the marks come back as tokens of their own.
+        flat = f' {DOC_MARK} '.join(
+            f' {SENT_MARK} '.join(ds)
+            for ds in doc_sents
+        )
+        tokens = self.join('\n', self.tok.tokenize(flat))
+        result = [[[]]]
+        for token in tokens.split('\n'):
+            if token == DOC_MARK:
+                result.append([[]])
+            elif token == SENT_MARK:
+                result[-1].append([])
+            elif token:
+                result[-1][-1].append(self._clean_word(token))
+        if len(result) != len(docs):
+            # The models lost a document mark, redo the batch per document
+            return [self.tokenize(doc) for doc in docs]
+        for i, (doc, ds) in enumerate(zip(docs, doc_sents)):
+            if not ds:
+                result[i] = []
+            elif len(result[i]) != len(ds):
+                # A sentence mark was lost or split off, redo the document
+                result[i] = self.tokenize(doc)
+        return result
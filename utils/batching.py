@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+'''
+Dynamic batching of window scoring requests.
+
+Callers submit the windows of one request (a [n, winsize] array of
+IDs) to a BatchScheduler and get a concurrent.futures.Future for their
+scores. A worker thread collects requests until `max_batch` windows are
+waiting or the oldest request has waited `max_wait` seconds, then
+scores them in one call. Batches are padded with windows of `pad` up to
+the next bucket size, so the model only ever sees a few batch shapes
+(one graph per shape when tracing or compiling). Requests larger than a
+batch are split over several.
+
+The scoring function runs on the worker thread only, so it may own
+state that is not thread safe, e.g. a CUDA stream. It must score every
+window on its own: the score of a window may not depend on the pad rows
+or on the windows of other requests in its batch. The TensorFlow
+networks (err_detect_model) do not qualify, their LSTM runs along the
+batch axis (see BaseModel.build_bilstm); score them with whole,
+unpadded requests instead.
+From asyncio code, await asyncio.wrap_future(scheduler.submit(w)).
+'''
+
+import time
+import threading
+from collections import deque, Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def bucket_sizes(max_batch, smallest=8):
+    '''
+    Powers of two from `smallest` up to `max_batch`, which is always
+    the last bucket.
+    '''
+    buckets = []
+    size = smallest
+    while size < max_batch:
+        buckets.append(size)
+        size *= 2
+    buckets.append(max_batch)
+    return buckets
+
+
+def pad_batch(windows, buckets, pad=0):
+    '''
+    `windows` with rows of `pad` appended up to the smallest bucket that
+    holds them.
+    '''
+    n = len(windows)
+    size = next(b for b in buckets if b >= n)
+    if size == n:
+        return windows
+    padded = np.full((size, windows.shape[1]), pad, dtype=windows.dtype)
+    padded[:n] = windows
+    return padded
+
+
+class _Request:
+    def __init__(self, windows):
+        self.windows = windows
+        self.future = Future()
+        self.arrival = time.perf_counter()
+        # Windows handed to a batch so far
+        self.taken = 0
+        self.scores = []
+
+    def remaining(self):
+        return len(self.windows) - self.taken
+
+
+class BatchScheduler:
+    '''
+    Coalesces scoring requests into batches for `score`, a function from
+    a [bucket, winsize] array of windows to one score per window.
+    Use as a context manager or call close() to stop the worker.
+    '''
+    def __init__(self, score, max_batch=256, max_wait=0.005, buckets=None, pad=0):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.buckets = buckets or bucket_sizes(max_batch)
+        if self.buckets[-1] < max_batch:
+            raise ValueError('Largest bucket is smaller than max_batch')
+        self.pad = pad
+        self.queue = deque()
+        self.n_waiting = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        # Windows per batch before padding, and batches per padded shape
+        self.batch_sizes = deque(maxlen=10000)
+        self.shapes = Counter()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, windows):
+        windows = np.asarray(windows)
+        request = _Request(windows)
+        if not len(windows):
+            request.future.set_result(np.empty(0, dtype=np.float32))
+            return request.future
+        with self.cond:
+            if self.closed:
+                raise RuntimeError('Scheduler is closed')
+            self.queue.append(request)
+            self.n_waiting += len(windows)
+            self.cond.notify()
+        return request.future
+
+    def __call__(self, windows):
+        '''
+        Blocking submit.
+        '''
+        return self.submit(windows).result()
+
+    def _wait(self):
+        '''
+        Block until a batch is due; False once closed and drained.
+        '''
+        with self.cond:
+            while True:
+                if self.queue:
+                    if self.n_waiting >= self.max_batch or self.closed:
+                        return True
+                    due = self.queue[0].arrival + self.max_wait
+                    timeout = due - time.perf_counter()
+                    if timeout <= 0:
+                        return True
+                    self.cond.wait(timeout)
+                elif self.closed:
+                    return False
+                else:
+                    self.cond.wait()
+
+    def _take(self):
+        '''
+        Up to max_batch windows from the head of the queue, as the
+        requests they belong to with the number of windows of each.
+        '''
+        parts = []
+        n = 0
+        with self.cond:
+            while self.queue and n < self.max_batch:
+                request = self.queue[0]
+                k = min(request.remaining(), self.max_batch - n)
+                parts.append((request, k))
+                request.taken += k
+                n += k
+                if not request.remaining():
+                    self.queue.popleft()
+            self.n_waiting -= n
+        return parts, n
+
+    def _run(self):
+        while self._wait():
+            parts, n = self._take()
+            windows = np.concatenate([
+                r.windows[r.taken - k:r.taken] for r, k in parts
+            ])
+            batch = pad_batch(windows, self.buckets, self.pad)
+            self.batch_sizes.append(n)
+            self.shapes[len(batch)] += 1
+            try:
+                scores = np.asarray(self.score(batch))[:n]
+            except Exception as ex:
+                for request, _ in parts:
+                    if not request.future.done():
+                        request.future.set_exception(ex)
+                continue
+            start = 0
+            for request, k in parts:
+                request.scores.append(scores[start:start + k])
+                start += k
+                if not request.remaining() and not request.future.done():
+                    request.future.set_result(np.concatenate(request.scores))
+
+    def stats(self):
+        sizes = list(self.batch_sizes)
+        return {
+            'batches': sum(self.shapes.values()),
+            'mean_batch': float(np.mean(sizes)) if sizes else 0.0,
+            'shapes': dict(self.shapes)
+        }
+
+    def close(self):
+        '''
+        Score what is still queued and stop the worker.
+        '''
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
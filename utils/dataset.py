@@ -2,8 +2,11 @@
 import os
 import re
 import collections
+from array import array
 from recordtype import recordtype
 
+import numpy as np
+
 from . import vocab
 from . import utils
 from . import tags
@@ -11,7 +14,10 @@ from . import tags
 
 class VocabMap:
     def _load_vocab(self, vocab_file):
-        if os.path.isfile(vocab_file):
+        if not isinstance(vocab_file, str):
+            # An already loaded vocabulary, e.g. a vocab.DeltaVocab
+            return vocab_file
+        elif os.path.isfile(vocab_file):
             print(f'Reusing vocabulary {vocab_file}')
             return vocab.Vocab.load(vocab_file, self.language)
         else:
@@ -90,6 +96,17 @@ class VocabMap:
 
             )
 
+    def add_to(self, doc, word):
+        '''
+        Map `word` like __call__ does and append it to the Document
+        `doc` without building the intermediate Word.
+        '''
+        doc.append(
+            self._get_word(self.surf_vocab, word.surface),
+            [self._get_word(self.lemma_vocab, lemma) for lemma in word.lemmas],
+            [map_pos(self.language, p) for p in word.pos]
+        )
+
     def print_word(self, word):
         surface = self.surf_vocab[word.surface]
         lemmas = {
@@ -123,6 +140,88 @@ Simple_word = recordtype('Word', ['surface'])
 ##maybe negative form should be created here, with info about neg forms tag
 ##if we need to get tags for all negative forms -- we will need to call for an analyser for them
 
+class Document:
+    '''
+    Mapped tokens of a document stored column-wise: surface IDs in one
+    int32 array, the lemma IDs of all tokens in another with offsets
+    marking where each token's lemmas start (CSR), and the POS set of
+    each token as a bitmask. A compound split into pieces takes one
+    token per piece.
+
+    word(i) and iteration give back Word objects for code that still
+    expects them.
+    '''
+    def __init__(self):
+        self._surfaces = array('i')
+        self._lemma_offsets = array('q', [0])
+        self._lemmas = array('i')
+        self._pos = array('H')
+
+    def append(self, surface, lemmas, pos):
+        self._surfaces.append(surface)
+        self._lemmas.extend(set(lemmas))
+        self._lemma_offsets.append(len(self._lemmas))
+        mask = 0
+        for p in pos:
+            mask |= 1 << p
+        self._pos.append(mask)
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    @property
+    def surfaces(self):
+        '''
+        Surface IDs of all tokens as an int32 array.
+        '''
+        return np.frombuffer(self._surfaces, dtype=np.int32)
+
+    @property
+    def pos_masks(self):
+        return np.frombuffer(self._pos, dtype=np.uint16)
+
+    def lemma_counts(self):
+        '''
+        Number of distinct lemmas of every token.
+        '''
+        return np.diff(np.frombuffer(self._lemma_offsets, dtype=np.int64))
+
+    def surface(self, i):
+        return self._surfaces[i]
+
+    def lemmas(self, i):
+        start, end = self._lemma_offsets[i], self._lemma_offsets[i + 1]
+        return set(self._lemmas[start:end])
+
+    def pos(self, i):
+        mask = self._pos[i]
+        return {p for p in range(mask.bit_length()) if mask >> p & 1}
+
+    def word(self, i):
+        return Word(
+            surface=self._surfaces[i],
+            lemmas=self.lemmas(i),
+            pos=self.pos(i)
+        )
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.word(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.word(i)
+
+    def nbytes(self):
+        return sum(
+            a.itemsize * len(a)
+            for a in (self._surfaces, self._lemma_offsets, self._lemmas, self._pos)
+        )
+
+
 PAD = Word(
     surface=vocab.padding_label,
     lemmas={vocab.padding_label},
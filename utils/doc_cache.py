@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+'''
+Binary cache of tokenized documents.
+
+A document is a list of sentences, a sentence a list of token strings.
+Tokens are interned and stored as int32 IDs, with offset arrays marking
+where sentences and documents start, so the file can be memory-mapped
+and any document read without parsing the rest. Layout:
+
+    header         magic, source size and mtime, section sizes
+    doc_offsets    int64[n_docs + 1], indices into sent_offsets
+    sent_offsets   int64[n_sents + 1], indices into tokens
+    type_offsets   int64[n_types + 1], byte offsets into the string table
+    tokens         int32[n_tokens]
+    strings        UTF-8 string table of the token types
+'''
+
+import os
+import struct
+from array import array
+
+import numpy as np
+
+MAGIC = b'BTOKv001'
+HEADER = struct.Struct('<8sQdQQQQQ')
+
+
+def _align(n):
+    return (n + 7) // 8 * 8
+
+
+def _source_stat(src_file):
+    st = os.stat(src_file)
+    return st.st_size, st.st_mtime
+
+
+class DocCacheWriter:
+    '''
+    Collects tokenized documents and writes the cache in one go on
+    commit(). The file is written under a temporary name and renamed,
+    so an interrupted run leaves no cache behind.
+    '''
+    def __init__(self, cache_file, src_file):
+        self.cache_file = cache_file
+        self.src_file = src_file
+        self.types = {}
+        self.doc_offsets = array('q', [0])
+        self.sent_offsets = array('q', [0])
+        self.tokens = array('i')
+
+    def add(self, sents):
+        types = self.types
+        for sent in sents:
+            for token in sent:
+                tid = types.get(token)
+                if tid is None:
+                    tid = types[token] = len(types)
+                self.tokens.append(tid)
+            self.sent_offsets.append(len(self.tokens))
+        self.doc_offsets.append(len(self.sent_offsets) - 1)
+
+    def commit(self):
+        encoded = [t.encode('utf-8') for t in self.types]
+        type_offsets = array('q', [0])
+        for e in encoded:
+            type_offsets.append(type_offsets[-1] + len(e))
+        blob = b''.join(encoded)
+        src_size, src_mtime = _source_stat(self.src_file)
+        header = HEADER.pack(
+            MAGIC,
+            src_size,
+            src_mtime,
+            len(self.doc_offsets) - 1,
+            len(self.sent_offsets) - 1,
+            len(self.tokens),
+            len(self.types),
+            len(blob)
+        )
+        tmp_file = f'{self.cache_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(header)
+            for arr in (self.doc_offsets, self.sent_offsets, type_offsets, self.tokens):
+                data = arr.tobytes()
+                f.write(data)
+                f.write(b'\0' * (_align(len(data)) - len(data)))
+            f.write(blob)
+        os.replace(tmp_file, self.cache_file)
+
+
+class DocCache:
+    '''
+    Read-only, memory-mapped view of a cache written by DocCacheWriter.
+    '''
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        with open(cache_file, 'rb') as f:
+            fields = HEADER.unpack(f.read(HEADER.size))
+        (magic, self.src_size, self.src_mtime, n_docs, n_sents,
+         n_tokens, n_types, n_bytes) = fields
+        if magic != MAGIC:
+            raise ValueError(f'{cache_file} is not a document cache.')
+        offset = HEADER.size
+        sections = []
+        for dtype, n in (
+                (np.int64, n_docs + 1),
+                (np.int64, n_sents + 1),
+                (np.int64, n_types + 1),
+                (np.int32, n_tokens),
+                (np.uint8, n_bytes)
+        ):
+            if n:
+                sections.append(np.memmap(
+                    cache_file, dtype=dtype, mode='r',
+                    offset=offset, shape=(n,)
+                ))
+            else:
+                sections.append(np.empty(0, dtype=dtype))
+            offset += _align(n * np.dtype(dtype).itemsize)
+        (self.doc_offsets, self.sent_offsets, self.type_offsets,
+         self.tokens, self.strings) = sections
+        self._types = None
+
+    @staticmethod
+    def is_valid(cache_file, src_file):
+        '''
+        True if `cache_file` is a complete cache of `src_file` as it
+        is now on disk.
+        '''
+        if not os.path.isfile(cache_file):
+            return False
+        try:
+            with open(cache_file, 'rb') as f:
+                fields = HEADER.unpack(f.read(HEADER.size))
+        except struct.error:
+            return False
+        magic, src_size, src_mtime = fields[:3]
+        return (
+            magic == MAGIC
+            and (src_size, src_mtime) == _source_stat(src_file)
+        )
+
+    @property
+    def types(self):
+        '''
+        Token strings, indexed by token ID. Decoded on first use.
+        '''
+        if self._types is None:
+            blob = self.strings.tobytes()
+            offs = self.type_offsets.tolist()
+            self._types = [
+                blob[offs[i]:offs[i + 1]].decode('utf-8')
+                for i in range(len(offs) - 1)
+            ]
+        return self._types
+
+    def doc_ids(self, n):
+        '''
+        Token IDs of document `n` and the sentence boundaries within
+        them, both as views into the mapped file.
+        '''
+        s_start, s_end = self.doc_offsets[n], self.doc_offsets[n + 1]
+        bounds = self.sent_offsets[s_start:s_end + 1]
+        return self.tokens[bounds[0]:bounds[-1]], bounds - bounds[0]
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        types = self.types
+        ids, bounds = self.doc_ids(n)
+        ids = ids.tolist()
+        bounds = bounds.tolist()
+        return [
+            [types[t] for t in ids[bounds[i]:bounds[i + 1]]]
+            for i in range(len(bounds) - 1)
+        ]
+
+    def __len__(self):
+        return len(self.doc_offsets) - 1
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
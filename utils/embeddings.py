@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+'''
+Pretrained vectors for a vocabulary, as a float32 .npy matrix with one
+row per word ID.
+
+Text files (word2vec .txt, fastText .vec, GloVe) are cut into byte
+ranges parsed by a pool of workers. A line is only split into numbers
+if its word is in the vocabulary, and every worker writes its rows
+straight into the memory-mapped output, so neither the source nor the
+output matrix is ever held in memory.
+
+fastText .bin models also give vectors to words they have not seen:
+the mean of the vectors of their character n-grams. These are computed
+for a whole chunk of out-of-vocabulary words at once, see
+SubwordVectors.
+
+Words without a vector get random ones as before; the padding label
+is all zeroes.
+'''
+
+import os
+import multiprocessing as mp
+
+import numpy as np
+
+from . import vocab
+
+# Source spellings of the special labels
+ALIASES = {
+    '<NUM>': vocab.number_label,
+    'NUMBER': vocab.number_label
+}
+
+# Set in the workers by _init_worker
+_src_file = None
+_out_file = None
+_word2index = None
+
+
+def _init_worker(src_file, out_file, word2index):
+    global _src_file, _out_file, _word2index
+    _src_file = src_file
+    _out_file = out_file
+    _word2index = word2index
+
+
+def read_header(src_file):
+    '''
+    (vector count or None, dimension, offset of the first vector line).
+    word2vec and fastText text files start with a "count dim" line,
+    GloVe files do not.
+    '''
+    with open(src_file, 'rb') as f:
+        first = f.readline()
+    fields = first.split()
+    if len(fields) == 2 and all(x.isdigit() for x in fields):
+        return int(fields[0]), int(fields[1]), len(first)
+    return None, len(fields) - 1, 0
+
+
+def byte_ranges(src_file, start, n):
+    '''
+    `n` ranges covering the file from `start`. A line belongs to the
+    range its first byte is in.
+    '''
+    size = os.path.getsize(src_file)
+    step = max((size - start) // n, 1)
+    bounds = list(range(start, size, step))[:n] + [size]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _map_range(task, flush_every=10000):
+    '''
+    Write the vectors of the vocabulary words in one byte range to the
+    output, returning their IDs.
+    '''
+    start, end = task
+    out = np.load(_out_file, mmap_mode='r+')
+    found = []
+    ids = []
+    rows = []
+
+    def flush():
+        if ids:
+            out[ids] = rows
+            found.extend(ids)
+            ids.clear()
+            rows.clear()
+
+    with open(_src_file, 'rb') as f:
+        pos = start
+        if start:
+            # Skip the end of a line that started in the previous range
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            word, _, rest = line.partition(b' ')
+            word = word.decode('utf-8', errors='replace')
+            i = _word2index.get(ALIASES.get(word, word))
+            if i is None:
+                continue
+            ids.append(i)
+            rows.append(np.array(rest.split(), dtype=np.float32))
+            if len(ids) >= flush_every:
+                flush()
+    flush()
+    out.flush()
+    return found
+
+
+def create_output(out_file, n_words, dim):
+    out = np.lib.format.open_memmap(
+        out_file,
+        mode='w+',
+        dtype=np.float32,
+        shape=(n_words, dim)
+    )
+    del out
+
+
+def fill_missing(out_file, found, seed=None, chunk=65536):
+    '''
+    Random vectors for the rows not in `found` and zeroes for padding.
+    Returns the number of random rows.
+    '''
+    out = np.load(out_file, mmap_mode='r+')
+    missing = np.ones(len(out), dtype=bool)
+    missing[list(found)] = False
+    missing[vocab.special_labels.index(vocab.padding_label)] = False
+    out[vocab.special_labels.index(vocab.padding_label)] = 0
+    rng = np.random.RandomState(seed)
+    for start in range(0, len(out), chunk):
+        rows = np.flatnonzero(missing[start:start + chunk]) + start
+        if len(rows):
+            out[rows] = rng.randn(len(rows), out.shape[1]).astype(np.float32)
+    out.flush()
+    return int(missing.sum())
+
+
+def map_text_vectors(src_file, words, out_file, workers=None, seed=None):
+    '''
+    Vectors of `words` (in ID order) from a text vector file, written
+    to `out_file`. Returns the number of words initialised randomly.
+    '''
+    _, dim, start = read_header(src_file)
+    create_output(out_file, len(words), dim)
+    word2index = {word: i for i, word in enumerate(words)}
+    workers = workers or os.cpu_count()
+    # Several ranges per worker so that they finish close together
+    tasks = byte_ranges(src_file, start, workers * 4)
+    ctx = mp.get_context('fork')
+    found = set()
+    with ctx.Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(src_file, out_file, word2index)
+    ) as pool:
+        for i, ids in enumerate(pool.imap_unordered(_map_range, tasks)):
+            found.update(ids)
+            print(f'\rProgress: {(i + 1) / len(tasks):.2%}', end='')
+    print()
+    return fill_missing(out_file, found, seed)
+
+
+def ft_hashes(ngrams):
+    '''
+    fastText's FNV-1a hashes of the UTF-8 strings `ngrams`, including
+    its treatment of bytes as signed chars. The strings are laid out as
+    a byte matrix and hashed one column at a time.
+    '''
+    data = [g.encode('utf-8') for g in ngrams]
+    lengths = np.fromiter(map(len, data), dtype=np.int64, count=len(data))
+    width = int(lengths.max()) if len(data) else 0
+    joined = np.frombuffer(b''.join(data), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    buf = np.zeros((len(data), width), dtype=np.uint64)
+    buf[
+        np.repeat(np.arange(len(data)), lengths),
+        np.arange(len(joined)) - np.repeat(starts, lengths)
+    ] = joined
+    # Sign extension of bytes >= 128 to 32 bits
+    buf[buf >= 128] |= 0xffffff00
+    h = np.full(len(data), 2166136261, dtype=np.uint64)
+    for c in range(width):
+        mixed = ((h ^ buf[:, c]) * 16777619) & 0xffffffff
+        h = np.where(c < lengths, mixed, h)
+    return h
+
+
+class SubwordVectors:
+    '''
+    Out-of-vocabulary vectors of a fastText model: the mean of the
+    vectors of the word's character n-grams, as fastText computes them.
+    `ngram_vectors` is the bucket matrix of the model.
+    '''
+    def __init__(self, ngram_vectors, min_n, max_n):
+        self.ngram_vectors = ngram_vectors
+        self.buckets = len(ngram_vectors)
+        self.min_n = min_n
+        self.max_n = max_n
+
+    def ngrams(self, word):
+        word = f'<{word}>'
+        return [
+            word[i:i + n]
+            for n in range(self.min_n, self.max_n + 1)
+            for i in range(len(word) - n + 1)
+        ]
+
+    def __getitem__(self, words, batch=2048):
+        '''
+        [len(words), dim] vectors. The n-grams of `batch` words at a time
+        are hashed, gathered and summed per word in one go.
+        '''
+        if len(words) > batch:
+            return np.concatenate([
+                self.__getitem__(words[i:i + batch], batch)
+                for i in range(0, len(words), batch)
+            ])
+        ngrams = [self.ngrams(word) for word in words]
+        counts = np.array([len(g) for g in ngrams], dtype=np.int64)
+        flat = ft_hashes([g for word_ngrams in ngrams for g in word_ngrams])
+        flat = (flat % self.buckets).astype(np.int64)
+        vectors = np.zeros((len(words), self.ngram_vectors.shape[1]), dtype=np.float32)
+        has = counts > 0
+        if flat.size:
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[has]
+            sums = np.add.reduceat(self.ngram_vectors[flat], starts, axis=0)
+            vectors[has] = sums / counts[has, None]
+        return vectors
+
+
+def map_fasttext(src_file, words, out_file, chunk=100000, seed=None):
+    '''
+    Vectors of `words` from a fastText .bin model, written to `out_file`
+    a chunk of words at a time. Words the model does not know get
+    subword vectors, so only the special labels are random.
+    '''
+    from gensim.models import FastText
+
+    print('Loading fastText model...')
+    wv = FastText.load_fasttext_format(src_file).wv
+    if hasattr(wv, 'key_to_index'):
+        key_to_index = wv.key_to_index
+    else:
+        key_to_index = {w: v.index for w, v in wv.vocab.items()}
+    subwords = SubwordVectors(wv.vectors_ngrams, wv.min_n, wv.max_n)
+    create_output(out_file, len(words), wv.vector_size)
+    out = np.load(out_file, mmap_mode='r+')
+    specials = set(vocab.special_labels)
+    found = []
+    n_oov = 0
+    for start in range(0, len(words), chunk):
+        known = []
+        known_src = []
+        oov = []
+        oov_words = []
+        for i, word in enumerate(words[start:start + chunk], start):
+            if word in specials:
+                continue
+            j = key_to_index.get(word)
+            if j is None:
+                oov.append(i)
+                oov_words.append(word)
+            else:
+                known.append(i)
+                known_src.append(j)
+        if known:
+            out[known] = wv.vectors[known_src]
+        if oov:
+            out[oov] = subwords[oov_words]
+        found.extend(known)
+        found.extend(oov)
+        n_oov += len(oov)
+        print(f'\rProgress: {min(start + chunk, len(words)) / len(words):.2%}', end='')
+    print()
+    out.flush()
+    del out
+    print(f'{n_oov / len(words):.2%} built from subwords.')
+    return fill_missing(out_file, found, seed)
+
+
+def map_vectors(src_file, vocab_file, out_file, workers=None, seed=None):
+    '''
+    Map the vocabulary `vocab_file` to the vectors of `src_file`, a
+    fastText .bin model or a text vector file, see map_fasttext and
+    map_text_vectors.
+    '''
+    surf_vocab = vocab.Vocab.load(vocab_file, None)
+    words = [surf_vocab.index2word[i] for i in range(len(surf_vocab))]
+    if src_file.endswith('.bin'):
+        n_random = map_fasttext(src_file, words, out_file, seed=seed)
+    else:
+        n_random = map_text_vectors(src_file, words, out_file, workers, seed)
+    print(f'{n_random / len(words):.2%} initialized randomly.')
+    return n_random
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+'''
+Word frequency counts that do not have to fit in memory.
+
+Counting: a StreamingCounter keeps at most `max_entries` words in a dict
+and spills them to sorted run files ("word<TAB>count" lines) whenever
+it fills up. Runs from any number of counters (e.g. one per corpus
+shard and worker) are merged with merge_runs(), which streams them and
+sums the counts of equal words. Optionally words seen no more than
+`tail` times before a spill go to a count-min sketch instead, which
+keeps the long tail of rare words in a fixed amount of memory at the
+price of overestimating their counts.
+
+Lookup: write_table() stores the merged counts as a FreqTable, a
+memory-mapped hash table (see vocab.FrozenVocab) with a parallel array
+of counts, so a process can look words up without loading the table.
+'''
+
+import os
+import json
+import mmap
+import heapq
+import struct
+import hashlib
+import itertools
+from array import array
+
+import numpy as np
+
+from . import vocab
+
+# Counts buffered before write_table() writes them out
+COUNTS_CHUNK = 2**16
+
+
+class CountMinSketch:
+    '''
+    `depth` rows of `width` counters. A word is counted in one cell per
+    row, its estimate is the smallest of these. Sketches of the same
+    shape are merged by adding them up.
+    '''
+    def __init__(self, width=2**20, depth=4, table=None):
+        if table is None:
+            table = np.zeros((depth, width), dtype=np.uint32)
+        self.table = table
+        self.depth, self.width = table.shape
+        self.rows = np.arange(self.depth)
+
+    def _cells(self, word):
+        digest = hashlib.blake2b(word.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, word, n=1):
+        self.table[self.rows, self._cells(word)] += n
+
+    def __getitem__(self, word):
+        return int(self.table[self.rows, self._cells(word)].min())
+
+    def merge(self, other):
+        self.table += other.table
+
+    def save(self, fname):
+        with open(fname, 'wb') as f:
+            np.save(f, self.table)
+
+    @staticmethod
+    def load(fname, mmap=False):
+        return CountMinSketch(
+            table=np.load(fname, mmap_mode='r' if mmap else None)
+        )
+
+
+def write_run(items, fname):
+    with open(fname, 'w', encoding='utf-8') as f:
+        for word, count in items:
+            print(f'{word}\t{count}', file=f)
+
+
+def read_run(fname):
+    with open(fname, 'r', encoding='utf-8') as f:
+        for line in f:
+            word, count = line.rstrip('\n').rsplit('\t', 1)
+            yield word, int(count)
+
+
+class StreamingCounter:
+    '''
+    Counts words in bounded memory, spilling sorted runs to
+    `run_prefix`.NNNN.tsv. close() returns the run files.
+    '''
+    def __init__(self, run_prefix, max_entries=1000000, tail=0, sketch=None):
+        self.run_prefix = run_prefix
+        self.max_entries = max_entries
+        self.tail = tail
+        self.sketch = sketch
+        self.counts = {}
+        self.runs = []
+
+    def add(self, word, n=1):
+        counts = self.counts
+        counts[word] = counts.get(word, 0) + n
+        if len(counts) >= self.max_entries:
+            self.spill()
+
+    def update(self, words):
+        for word in words:
+            self.add(word)
+
+    def spill(self):
+        if not self.counts:
+            return
+        items = self.counts.items()
+        if self.sketch is not None and self.tail:
+            for word, count in items:
+                if count <= self.tail:
+                    self.sketch.add(word, count)
+            items = [(w, c) for w, c in items if c > self.tail]
+        fname = f'{self.run_prefix}.{len(self.runs):04d}.tsv'
+        write_run(sorted(items), fname)
+        self.runs.append(fname)
+        self.counts = {}
+
+    def close(self):
+        self.spill()
+        return self.runs
+
+
+def merge_runs(run_files):
+    '''
+    Sorted (word, count) pairs with the counts of all runs summed up.
+    '''
+    merged = heapq.merge(*(read_run(f) for f in run_files))
+    for word, group in itertools.groupby(merged, key=lambda wc: wc[0]):
+        yield word, sum(c for _, c in group)
+
+
+def write_table(items, fname, min_count=1, sketch=None):
+    '''
+    Write (word, count) pairs with at least `min_count` occurrences as
+    a FreqTable: the words to `fname` in the vocab.FrozenVocab format,
+    their counts to `fname`.counts and the sketch, if any, to
+    `fname`.cms.npy. The pairs are streamed, e.g. from merge_runs(),
+    and are not held in memory.
+    '''
+    def kept():
+        # Counts go to their file as the words stream to write_frozen
+        with open(fname + '.counts', 'wb') as f:
+            counts = array('q')
+            for word, count in items:
+                if count >= min_count:
+                    counts.append(count)
+                    if len(counts) >= COUNTS_CHUNK:
+                        counts.tofile(f)
+                        del counts[:]
+                    yield word
+            counts.tofile(f)
+
+    vocab.write_frozen(kept(), fname)
+    if sketch is not None:
+        sketch.save(fname + '.cms.npy')
+
+
+class FreqTable:
+    '''
+    Read-only, memory-mapped word counts written by write_table(). Works
+    as a stand-in for the frequency dict: `in`, [], get() and len().
+    If there is a sketch, its estimate is added to every count, so counts
+    may be too high but never too low.
+    '''
+    def __init__(self, fname):
+        self.fname = fname
+        self.words = vocab.FrozenVocab(fname)
+        if len(self.words):
+            with open(fname + '.counts', 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.counts = memoryview(self._mm).cast('q')
+        else:
+            self.counts = []
+        sketch_file = fname + '.cms.npy'
+        if os.path.isfile(sketch_file):
+            self.sketch = CountMinSketch.load(sketch_file, mmap=True)
+        else:
+            self.sketch = None
+
+    def __getstate__(self):
+        return {'fname': self.fname}
+
+    def __setstate__(self, state):
+        self.__init__(state['fname'])
+
+    def get(self, word, default=None):
+        i = self.words.get(word)
+        count = 0 if i is None else self.counts[i]
+        if self.sketch is not None:
+            # A word can have been in the tail of some spills only
+            count += self.sketch[word]
+        if i is None and not count:
+            return default
+        return count
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __getitem__(self, word):
+        count = self.get(word)
+        if count is None:
+            raise KeyError(word)
+        return count
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def items(self):
+        return zip(self.words, self.counts)
+
+
+def load(fname):
+    '''
+    Frequency dict from `fname`, a FreqTable or a legacy JSON dict.
+    '''
+    if fname.endswith('.json'):
+        with open(fname, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return FreqTable(fname)
@@ -4,12 +4,16 @@ import os
 import ujson
 import hashlib
 import codecs
+import sqlite3
 from collections import defaultdict
 
 from tokenizer import Tokenizer
 from analyser.analyzer_wrapper import Analyzer
 
 from utils import dataset
+from utils import utils
+from utils import vocab
+from utils import doc_cache
 import random
 import string
 
@@ -17,6 +21,9 @@ CACHE_DIR = '.cache'
 if not os.path.isdir(CACHE_DIR):
     os.makedirs(CACHE_DIR)
 
+# POS of punctuation in pre-analysed documents and in analyser output
+PUNCT_POS = {'PUNCT', 'Punct'}
+
 
 # Russian
 def map_characters(token):
@@ -97,31 +104,173 @@ class BadTagsComb:
             ujson.dump(self.tags, cf, ensure_ascii=False)
 
 
+class AnalysisStore:
+    '''
+    On-disk key-value store of analyses, backed by SQLite.
+
+    Entries are read lazily, one surface at a time, and new entries are
+    appended in batches, so neither opening nor saving the store touches
+    the whole table. The database runs in WAL mode, which lets any number
+    of processes read while one of them writes. Connections must not be
+    shared across fork(), open a store per process instead.
+    '''
+    def __init__(self, db_file, timeout=60):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file, timeout=timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS analyses ('
+            'surface TEXT PRIMARY KEY, '
+            'analyses TEXT NOT NULL)'
+        )
+        # Memoized participle lemmas of the Russian analyser, NULL when
+        # the surface has no participle reading
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS participles ('
+            'surface TEXT PRIMARY KEY, '
+            'lemma TEXT)'
+        )
+        self.conn.commit()
+
+    def get(self, surface):
+        row = self.conn.execute(
+            'SELECT analyses FROM analyses WHERE surface = ?',
+            (surface,)
+        ).fetchone()
+        if row is None:
+            return None
+        return ujson.loads(row[0])
+
+    def __contains__(self, surface):
+        row = self.conn.execute(
+            'SELECT 1 FROM analyses WHERE surface = ?',
+            (surface,)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self.conn.execute(
+            'SELECT COUNT(*) FROM analyses'
+        ).fetchone()[0]
+
+    def update(self, entries):
+        rows = (
+            (surface, ujson.dumps(analyses, ensure_ascii=False))
+            for surface, analyses in entries.items()
+        )
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO analyses VALUES (?, ?)',
+                rows
+            )
+
+    def participle(self, surface):
+        '''
+        Stored participle lemma of `surface`, KeyError if there is none.
+        '''
+        row = self.conn.execute(
+            'SELECT lemma FROM participles WHERE surface = ?',
+            (surface,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(surface)
+        return row[0]
+
+    def update_participles(self, entries):
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO participles VALUES (?, ?)',
+                entries.items()
+            )
+
+    def close(self):
+        self.conn.close()
+
+
 class MemoAnalyser:
     def _cache_fname(self):
+        return os.path.join(CACHE_DIR, f'analyses_{self.lang}.db')
+
+    def _legacy_fname(self):
         return os.path.join(CACHE_DIR, f'analyses_{self.lang}.json')
 
     def analyse(self, arg):
-        if arg not in self.results:
-            a = self.analyser.analyze(arg)
-            self.results[arg] = a['analyses'][self.lang]
-        return self.results[arg]
+        a = self.results.get(arg)
+        if a is None:
+            a = self.store.get(arg)
+            if a is None:
+                a = self.analyser.analyze(arg)['analyses'][self.lang]
+                self.new[arg] = a
+                if len(self.new) >= self.flush_every:
+                    self.save()
+            self.results[arg] = a
+        return a
+
+    def analyse_many(self, args):
+        '''
+        Analyse a list of words, returning the analyses in input order.
+        Words found neither in memory nor on disk go to the analyser
+        in a single batch.
+        '''
+        found = {}
+        missing = []
+        for arg in dict.fromkeys(args):
+            a = self.results.get(arg)
+            if a is None:
+                a = self.store.get(arg)
+            if a is None:
+                missing.append(arg)
+            else:
+                found[arg] = a
+        if missing:
+            batch = self.analyser.analyze_many(missing)
+            for arg, a in zip(missing, batch):
+                a = a['analyses'][self.lang]
+                found[arg] = a
+                self.new[arg] = a
+            if len(self.new) >= self.flush_every:
+                self.save()
+        for arg, a in found.items():
+            self.results[arg] = a
+        return [found[arg] for arg in args]
 
     def load(self):
-        if os.path.isfile(self.cache_file):
-            print('Loading analyses from cache')
-            with open(self.cache_file, 'r') as cf:
-                self.results.update(ujson.load(cf))
+        # One-off import of the old single JSON blob cache
+        legacy = self._legacy_fname()
+        if os.path.isfile(legacy) and not len(self.store):
+            print('Importing analyses from', legacy)
+            with open(legacy, 'r') as cf:
+                self.store.update(ujson.load(cf))
+        if hasattr(self.analyser, 'set_participle_lookup'):
+            # Participle lemmas are read from the store one at a time
+            self.analyser.set_participle_lookup(self.store.participle)
 
     def save(self):
-        with open(self.cache_file, 'w') as cf:
-            ujson.dump(self.results, cf, ensure_ascii=False)
-
-    def __init__(self, lang):
+        if self.new:
+            self.store.update(self.new)
+            self.new = {}
+        if hasattr(self.analyser, 'new_participles'):
+            new = self.analyser.new_participles()
+            if new:
+                self.store.update_participles(new)
+
+    def stats(self):
+        if isinstance(self.results, dict):
+            return {'size': len(self.results)}
+        return self.results.stats()
+
+    def __init__(self, lang, cache_size=200000, policy='lru',
+                 freq_dict=None, flush_every=10000):
         self.lang = lang
         self.analyser = Analyzer(lang)
-        self.results = {}
+        # Bounded in-memory front of the on-disk store, see utils.make_cache
+        self.results = utils.make_cache(cache_size, policy, freq_dict)
+        # Analyses computed since the last save()
+        self.new = {}
+        self.flush_every = flush_every
         self.cache_file = self._cache_fname()
+        self.store = AnalysisStore(self.cache_file)
         self.load()
 
     def __next__(self):
@@ -131,31 +280,50 @@ class MemoAnalyser:
 class BatchTokenizer:
     def _cache_fname(self, fname):
         h = hashlib.sha1(os.path.abspath(fname).encode()).hexdigest()
-        return os.path.join(CACHE_DIR, f'{h}_{self.lang}.json')
+        return os.path.join(CACHE_DIR, f'{h}_{self.lang}.tok')
 
-    def _cached_gen(self, docs_cache):
-        with open(docs_cache, 'r') as dc:
-            for doc in dc:
-                yield ujson.loads(doc)
+    def _cached_gen(self, cache):
+        yield from cache
+
+    def _tokenize_batch(self, batch, writer):
+        for sents in self.tokenizer.tokenize_many(batch):
+            writer.add(sents)
+            yield sents
 
     def _make_gen(self, fname, docs_cache):
-        with codecs.open(fname, 'r', encoding='utf-8', errors='ignore') as inf, \
-                open(docs_cache, 'w') as dc:
+        writer = doc_cache.DocCacheWriter(docs_cache, fname)
+        with codecs.open(fname, 'r', encoding='utf-8', errors='ignore') as inf:
+            batch = []
             for doc in filter(bool, inf):
-                sents = self.tokenizer.tokenize(doc)
-                print(ujson.dumps(sents, ensure_ascii=False), file=dc)
-                yield sents
-
-    def __init__(self, lang, fname):
+                batch.append(doc)
+                if len(batch) >= self.batch_size:
+                    yield from self._tokenize_batch(batch, writer)
+                    batch = []
+            yield from self._tokenize_batch(batch, writer)
+        # Only a complete pass over the file produces a cache
+        writer.commit()
+
+    def __init__(self, lang, fname, batch_size=256):
         self.lang = lang
+        self.batch_size = batch_size
+        self.cache = None
         docs_cache = self._cache_fname(fname)
-        if os.path.isfile(docs_cache):
+        if doc_cache.DocCache.is_valid(docs_cache, fname):
             print('Loading tokenized documents from cache')
-            self.generator = self._cached_gen(docs_cache)
+            self.cache = doc_cache.DocCache(docs_cache)
+            self.generator = self._cached_gen(self.cache)
         else:
             self.tokenizer = Tokenizer(lang)
             self.generator = self._make_gen(fname, docs_cache)
 
+    def __getitem__(self, n):
+        '''
+        Random access to document `n`, only available from the cache.
+        '''
+        if self.cache is None:
+            raise IndexError('Documents are not cached yet.')
+        return self.cache[n]
+
     def __iter__(self):
         return self
 
@@ -164,30 +332,44 @@ class BatchTokenizer:
 
 
 class DocMapper:
+    def _analyse_doc(self, words):
+        '''
+        Analyse all the words of a document in one batch.
+        '''
+        words = list(words)
+        return dict(zip(words, self.analyser.analyse_many(words)))
+
     def _fi_make_gen(self, doc):
+        if self.analyser:
+            doc_analyses = self._analyse_doc(
+                word.lower()
+                for sent in doc
+                for word in sent
+            )
         for i, sent in enumerate(doc):
             if not self.analyser:
                 sent = sent['features']
             for j, word in enumerate(sent):
                 self._curr = (i, j)
                 if self.analyser:
-                    surface = surface.lower()
-                    analyses = self.analyser.analyse(surface)
+                    surface = word.lower()
+                    analyses = doc_analyses[surface]
+                    poses = {a[0]['pos'] for a in analyses if a}
                 else:
                     surface = word['surface'].lower()
                     analyses = word['analyses']
+                    poses = {word['pos']}
                 if surface in self.names:
-                    yield self.vomap(dataset.NAME)
+                    yield dataset.NAME
                 elif surface in ['PAD', 'pad']:
-                    yield self.vomap(dataset.PAD)
-                elif surface in string.punctuation or surface in ['``', '„'] or word['pos'] == 'PUNCT':
-                    yield self.vomap(dataset.PUNCT)
+                    yield dataset.PAD
+                elif surface in string.punctuation or surface in ['``', '„'] or poses & PUNCT_POS:
+                    yield dataset.PUNCT
                 elif dataset.is_num(surface) or surface in ['NUM', 'num']:
-                    yield self.vomap(dataset.NUM)
-                elif self.freq_dict and surface not in self.freq_dict:
-                    yield self.vomap(dataset.UNK)
-                elif self.freq_dict and surface in self.freq_dict and self.freq_dict[surface] == 1:
-                    yield self.vomap(dataset.UNK)
+                    yield dataset.NUM
+                elif self.freq_dict and self.freq_dict.get(surface, 0) <= 1:
+                    # unseen or hapax
+                    yield dataset.UNK
                 elif analyses:
                     yield self._process_word(surface, analyses)
 
@@ -200,27 +382,31 @@ class DocMapper:
                 yield word
 
     def _ru_make_gen(self, doc):
+        doc_analyses = self._analyse_doc(
+            fix_e(map_characters(word.lower()))
+            for sent in doc
+            for word in sent
+        )
         for i, sent in enumerate(doc):
             for j, word in enumerate(sent):
                 self._curr = (i, j)
                 word = word.lower()
                 word = map_characters(word)
                 e_word = fix_e(word)  # Ugly hack
-                analyses = self.analyser.analyse(e_word)
+                analyses = doc_analyses[e_word]
                 if word in self.names:
-                    yield self.vomap(dataset.NAME)
+                    yield dataset.NAME
                 elif word in ['PAD', 'pad']:
-                    yield self.vomap(dataset.PAD)
+                    yield dataset.PAD
                 elif word in string.punctuation or word in ['``', '„']:
-                    yield self.vomap(dataset.PUNCT)
+                    yield dataset.PUNCT
                 elif dataset.is_num(word) or word in ['NUM', 'num']:
-                    yield self.vomap(dataset.NUM)
+                    yield dataset.NUM
                 elif word in ['LAT', 'lat']:
-                    yield self.vomap(dataset.LAT)
-                elif self.freq_dict and word not in self.freq_dict:
-                    yield self.vomap(dataset.UNK)
-                elif self.freq_dict and word in self.freq_dict and self.freq_dict[word] == 1:
-                    yield self.vomap(dataset.UNK)
+                    yield dataset.LAT
+                elif self.freq_dict and self.freq_dict.get(word, 0) <= 1:
+                    # unseen or hapax
+                    yield dataset.UNK
                 elif analyses:
                     yield self._process_word(word, analyses)
                 else:
@@ -231,22 +417,26 @@ class DocMapper:
                         if analyses:
                             yield self._process_word(word, analyses)
                         else:
-                            yield self.vomap(dataset.UNK)
+                            yield dataset.UNK
                     else:
-                        yield self.vomap(dataset.UNK)
+                        yield dataset.UNK
 
 
     def _process_word(self, word, analyses):
+        '''
+        The unmapped Word for `word`, or a list of them for the pieces
+        of a compound.
+        '''
         if self.language == 'Russian':
-            token = dataset.get_word_object(word, analyses)
+            return dataset.get_word_object(word, analyses)
         elif self.language == 'Finnish':
-            token = dataset.split_compound(word, analyses)
-        tokens = []
-        if type(token) == list:
-            for t in token:
-                tokens.append(self.vomap(t))
-        if tokens:
-            return tokens
+            return dataset.split_compound(word, analyses)
+
+    def _map(self, token):
+        if self.mode == 'token':
+            return token
+        elif type(token) == list:
+            return [self.vomap(t) for t in token]
         else:
             return self.vomap(token)
 
@@ -264,7 +454,7 @@ class DocMapper:
         self.names = names
         if self.language == 'Russian':
             if self.mode == 'token':
-                self.generator = self.ru_make_simple_gen(doc)
+                self.generator = self._ru_make_simple_gen(doc)
             else:
                 self.generator = self._ru_make_gen(doc)
         elif self.language == 'Finnish':
@@ -274,7 +464,44 @@ class DocMapper:
         return self
 
     def __next__(self):
-        ret = next(self.generator)
+        ret = self._map(next(self.generator))
         self.index[self._curr].append(self._count)
         self._count += 1
         return ret
+
+    def to_document(self):
+        '''
+        Map the whole document into a dataset.Document. Compound pieces
+        become tokens of their own, and `index` maps each (sentence, word)
+        position to the offsets of its tokens in the Document.
+        '''
+        doc = dataset.Document()
+        add_to = self.vomap.add_to
+        for token in self.generator:
+            pieces = token if type(token) == list else [token]
+            for piece in pieces:
+                self.index[self._curr].append(len(doc))
+                add_to(doc, piece)
+        self._count = len(doc)
+        return doc
+
+
+def map_windows(sents, analyser, vomap, language, radius, names=frozenset(), freq_dict=None):
+    '''
+    Windows of surface IDs around every token of the tokenized document
+    `sents`, mapped by DocMapper as the training data is, and for every
+    word of `sents` the index of its window, or None if it maps to no
+    token.
+    '''
+    dm = DocMapper(sents, analyser, vomap, language, names, freq_dict)
+    doc = dm.to_document()
+    pad = vomap.surf_vocab[vocab.padding_label]
+    windows = utils.sliding_windows(doc.surfaces, radius, 1, pad)
+    positions = [
+        [
+            dm.index[(i, j)][0] if (i, j) in dm.index else None
+            for j in range(len(sent))
+        ]
+        for i, sent in enumerate(sents)
+    ]
+    return windows, positions
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+'''
+Reduced precision embedding tables.
+
+float16 tables are a plain cast. int8 tables are quantised row by row
+and symmetrically: every row has its own float16 scale, max|row| / 127,
+so rare words with small vectors keep their precision. Lookups
+dequantise only the rows asked for, a full float32 copy of the table
+is never made.
+
+calibrate_threshold() fits the decision threshold of a quantised model
+to the float model's on held-out data, see scripts/eval_quantized.py.
+'''
+
+import os
+
+import numpy as np
+
+MODES = ['none', 'float16', 'int8']
+
+
+def quantize_rows(matrix, mode='int8', chunk=65536):
+    '''
+    `matrix` in reduced precision, as (table, scale). scale is None
+    unless mode is int8. Works through the rows `chunk` at a time, so
+    `matrix` can be memory-mapped.
+    '''
+    if mode == 'float16':
+        return np.asarray(matrix, dtype=np.float16), None
+    if mode != 'int8':
+        raise ValueError(f'Unknown quantisation mode {mode}')
+    table = np.empty(matrix.shape, dtype=np.int8)
+    scale = np.empty(len(matrix), dtype=np.float16)
+    for start in range(0, len(matrix), chunk):
+        rows = np.asarray(matrix[start:start + chunk], dtype=np.float32)
+        s = np.abs(rows).max(axis=1) / 127
+        s[s == 0] = 1
+        # Round the scale first so the table is quantised with the
+        # scale it is dequantised with
+        s = s.astype(np.float16)
+        table[start:start + chunk] = np.clip(
+            np.rint(rows / s.astype(np.float32)[:, None]),
+            -127,
+            127
+        )
+        scale[start:start + chunk] = s
+    return table, scale
+
+
+class QuantizedEmbeddings:
+    '''
+    An embedding table that returns float32 rows for an array of IDs of
+    any shape, like indexing the float matrix would.
+    '''
+    def __init__(self, table, scale=None):
+        self.table = table
+        self.scale = scale
+        self.shape = table.shape
+
+    @staticmethod
+    def from_array(matrix, mode='int8'):
+        return QuantizedEmbeddings(*quantize_rows(matrix, mode))
+
+    @property
+    def mode(self):
+        return 'int8' if self.scale is not None else str(self.table.dtype)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes + (0 if self.scale is None else self.scale.nbytes)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, ids):
+        rows = self.table[ids].astype(np.float32)
+        if self.scale is not None:
+            rows *= self.scale[ids].astype(np.float32)[..., None]
+        return rows
+
+    def save(self, prefix):
+        np.save(prefix + '.table.npy', self.table)
+        if self.scale is not None:
+            np.save(prefix + '.scale.npy', self.scale)
+
+    @staticmethod
+    def load(prefix, mmap=True):
+        mode = 'r' if mmap else None
+        scale_file = prefix + '.scale.npy'
+        return QuantizedEmbeddings(
+            np.load(prefix + '.table.npy', mmap_mode=mode),
+            np.load(scale_file, mmap_mode=mode) if os.path.isfile(scale_file) else None
+        )
+
+
+def load_embeddings(fname, mode='none'):
+    '''
+    The .npy embedding matrix `fname`, memory-mapped. For a reduced
+    precision `mode` the quantised table is kept next to it as
+    `fname`.`mode`.table.npy and rebuilt when older than `fname`.
+    '''
+    if mode == 'none':
+        return np.load(fname, mmap_mode='r')
+    prefix = f'{fname}.{mode}'
+    table_file = prefix + '.table.npy'
+    if (
+        not os.path.isfile(table_file)
+        or os.path.getmtime(table_file) < os.path.getmtime(fname)
+    ):
+        print(f'Quantising {fname} to {mode}')
+        QuantizedEmbeddings.from_array(np.load(fname, mmap_mode='r'), mode).save(prefix)
+    return QuantizedEmbeddings.load(prefix)
+
+
+def calibrate_threshold(ref_probs, probs, threshold=0.5):
+    '''
+    Threshold for `probs` that flags the same share of windows as
+    `threshold` does for `ref_probs`, the float model's probabilities
+    on the same windows.
+    '''
+    rate = np.mean(np.asarray(ref_probs) >= threshold)
+    if rate == 0:
+        return float(np.max(probs)) + 1e-6
+    return float(np.quantile(probs, 1 - rate))
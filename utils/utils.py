@@ -6,11 +6,14 @@ import argparse
 import ujson
 import pymongo
 import curses
+import resource
 
 import subprocess as sp
+import numpy as np
 
 from functools import partial
 from string import Formatter
+from collections import OrderedDict
 
 
 class SlidingWindow:
@@ -49,6 +52,53 @@ class SlidingWindow:
             return window
 
 
+def sliding_windows(ids, radius, stride, pad=0):
+    '''
+    All windows of `radius` tokens around every `stride`-th token of a
+    document, as a (n_windows, 2 * radius + 1) array. Same windows as
+    SlidingWindow, but the document is padded once and the windows are
+    a strided view into it, nothing is copied per window.
+    '''
+    ids = np.asarray(ids, dtype=np.int32)
+    if not len(ids):
+        return np.empty((0, 2 * radius + 1), dtype=np.int32)
+    padded = np.full(len(ids) + 2 * radius, pad, dtype=np.int32)
+    padded[radius:radius + len(ids)] = ids
+    windows = np.lib.stride_tricks.sliding_window_view(
+        padded,
+        2 * radius + 1
+    )
+    return windows[:len(ids):stride]
+
+
+def npy_chunks(fname, rows=65536):
+    '''
+    (offset, block) pairs of at most `rows` rows of the 2D .npy file
+    `fname`. The file is read, not mapped, so only one block at a time
+    counts towards the resident memory.
+    '''
+    with open(fname, 'rb') as f:
+        major, _ = np.lib.format.read_magic(f)
+        if major == 1:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        if fortran_order or len(shape) != 2:
+            raise ValueError(f'{fname} is not a C-ordered matrix')
+        for start in range(0, shape[0], rows):
+            n = min(rows, shape[0] - start)
+            block = np.fromfile(f, dtype=dtype, count=n * shape[1])
+            yield start, block.reshape(n, shape[1])
+
+
+def special_counts(windows, n_special):
+    '''
+    Number of special tokens (IDs below `n_special`: pad, unk, ...)
+    in every window.
+    '''
+    return np.count_nonzero(windows < n_special, axis=1)
+
+
 class BulkWriter:
     def __init__(self, collection, max_ops=1000):
         self.collection = collection
@@ -66,6 +116,64 @@ class BulkWriter:
             self.execute()
 
 
+class ColumnWriter:
+    '''
+    Appends rows of fixed-type columns to one raw binary file per column
+    in `out_dir`, with the dtypes and row count in meta.json. Read it
+    back with load_columns(), which memory-maps the columns.
+    '''
+    def __init__(self, out_dir, columns):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.columns = {name: np.dtype(dt) for name, dt in columns.items()}
+        self.files = {
+            name: open(os.path.join(out_dir, f'{name}.bin'), 'wb')
+            for name in self.columns
+        }
+        self.rows = 0
+
+    def write(self, **arrays):
+        n = None
+        for name, dt in self.columns.items():
+            data = np.asarray(arrays[name], dtype=dt)
+            if n is not None and len(data) != n:
+                raise ValueError(f'Column {name} has {len(data)} rows, expected {n}.')
+            n = len(data)
+            self.files[name].write(data.tobytes())
+        self.rows += n
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        meta = {
+            'rows': self.rows,
+            'columns': {name: dt.str for name, dt in self.columns.items()}
+        }
+        with open(os.path.join(self.out_dir, 'meta.json'), 'w') as f:
+            ujson.dump(meta, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def load_columns(out_dir):
+    with open(os.path.join(out_dir, 'meta.json'), 'r') as f:
+        meta = ujson.load(f)
+    return {
+        name: np.memmap(
+            os.path.join(out_dir, f'{name}.bin'),
+            dtype=dt,
+            mode='r',
+            shape=(meta['rows'],)
+        ) if meta['rows'] else np.empty(0, dtype=dt)
+        for name, dt in meta['columns'].items()
+    }
+
+
 class MongoDict:
     def __init__(self, collection, key):
         self.dictionary = {}
@@ -326,14 +434,163 @@ pickle_cache = partial(_cache_fn, fmt='pck')
 json_cache = partial(_cache_fn, fmt='json')
 
 
-def memoize(fun):
-    results = {}
-    def wrapper(*args, **kwargs):
-        sig = args + tuple(kwargs.items())
-        if sig not in results:
-            results[sig] = fun(*args, **kwargs)
-        return results[sig]
-    return wrapper
+class LRUCache:
+    '''
+    Dictionary-like cache holding at most `maxsize` entries, evicting
+    the least recently used one when full.
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.data:
+            self.data.move_to_end(key)
+        elif len(self.data) >= self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+        self.data[key] = value
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        return {
+            'size': len(self.data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class LFUCache(LRUCache):
+    '''
+    Cache evicting the least frequently used entry, ties broken by
+    recency. If `seed` is given (e.g. the corpus frequency dict), a new
+    entry starts with its corpus count, so frequent words stay cached
+    even before they have been seen often in this run.
+    '''
+    def __init__(self, maxsize, seed=None):
+        super().__init__(maxsize)
+        self.seed = seed
+        self.data = {}
+        self.freq = {}
+        # frequency -> keys with that frequency, oldest first
+        self.buckets = {}
+        self.min_freq = 0
+
+    def _touch(self, key):
+        f = self.freq[key]
+        bucket = self.buckets[f]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[f]
+            if self.min_freq == f:
+                self.min_freq = f + 1
+        self.freq[key] = f + 1
+        self.buckets.setdefault(f + 1, OrderedDict())[key] = None
+
+    def _evict(self):
+        if self.min_freq not in self.buckets:
+            self.min_freq = min(self.buckets)
+        bucket = self.buckets[self.min_freq]
+        key, _ = bucket.popitem(last=False)
+        if not bucket:
+            del self.buckets[self.min_freq]
+        del self.data[key]
+        del self.freq[key]
+        self.evictions += 1
+
+    def get(self, key, default=None):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._touch(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.data:
+            self.data[key] = value
+            self._touch(key)
+            return
+        if len(self.data) >= self.maxsize:
+            self._evict()
+        f = 1
+        if self.seed:
+            f += self.seed.get(key, 0)
+        self.data[key] = value
+        self.freq[key] = f
+        self.buckets.setdefault(f, OrderedDict())[key] = None
+        if len(self.data) == 1 or f < self.min_freq:
+            self.min_freq = f
+
+
+_missing = object()
+
+
+def make_cache(maxsize, policy='lru', freq_dict=None):
+    '''
+    Return a bounded cache. `policy` is one of 'lru', 'lfu' or 'freq'
+    (LFU seeded with counts from `freq_dict`). A `maxsize` of None gives
+    a plain unbounded dict.
+    '''
+    if maxsize is None:
+        return {}
+    if policy == 'lru':
+        return LRUCache(maxsize)
+    elif policy == 'lfu':
+        return LFUCache(maxsize)
+    elif policy == 'freq':
+        return LFUCache(maxsize, seed=freq_dict)
+    else:
+        raise ValueError(f'Unknown cache policy: {policy}')
+
+
+def memoize(fun=None, maxsize=100000, policy='lru'):
+    '''
+    Memoize a function in a bounded cache. Can be used both as
+    @memoize and as @memoize(maxsize=..., policy=...).
+    The cache is available as `wrapper.cache`.
+    '''
+    def decorator(fun):
+        results = make_cache(maxsize, policy)
+        def wrapper(*args, **kwargs):
+            sig = args + tuple(kwargs.items())
+            retv = results.get(sig, _missing)
+            if retv is _missing:
+                retv = fun(*args, **kwargs)
+                results[sig] = retv
+            return retv
+        wrapper.cache = results
+        return wrapper
+    if fun is None:
+        return decorator
+    return decorator(fun)
 
 
 def count_lines(fname):
@@ -344,3 +601,14 @@ def count_lines(fname):
     )
     print(wproc.stdout.split(' '))
     return int(wproc.stdout.split(' ')[0])
+
+
+def memory_usage():
+    '''
+    Resident and peak resident memory of this process in MiB.
+    '''
+    with open('/proc/self/statm', 'r') as f:
+        rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return rss / 2**20, peak / 2**20
@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import os
 import re
+import mmap
+import zlib
+import struct
+import shutil
+import operator
 from multiprocessing.managers import BaseManager, NamespaceProxy
 import json
+from array import array
+from collections import defaultdict
 #new
 padding_label = 'pad'
 unknown_label = 'unk'
@@ -10,6 +18,14 @@ number_label = 'num'
 name_label = 'name'
 punct_label = 'punct'
 lat_label = 'lat'
+special_labels = [
+    padding_label,
+    unknown_label,
+    number_label,
+    punct_label,
+    name_label,
+    lat_label
+]
 #old
 # padding_label = 'PAD'
 # unknown_label = 'UNK'
@@ -80,12 +96,33 @@ class Vocab():
                 except KeyError:
                     continue
             
+    def save_binary(self, output_file):
+        write_frozen(
+            (self.index2word.get(i, '') for i in range(self.index)),
+            output_file
+        )
+
     @staticmethod
     def load(input_file, language):
-        vocab = Vocab(True, language)
+        '''
+        Words keep the IDs of their first line. The dictionaries are
+        built in one go instead of through add(), which would count
+        every loaded word as an occurrence.
+        '''
+        vocab = Vocab(False, language)
         with open(input_file, 'r') as f:
-            for word in f:
-                vocab.add(word.strip())
+            words = [word.strip() for word in f]
+        # Saved vocabularies start with the special labels already
+        if words[:len(special_labels)] != special_labels:
+            words = special_labels + words
+        word2index = {word: i for i, word in enumerate(words)}
+        if len(word2index) != len(words):
+            words = list(dict.fromkeys(words))
+            word2index = {word: i for i, word in enumerate(words)}
+        vocab.word2index = word2index
+        vocab.index2word = dict(enumerate(words))
+        vocab.word_freq = defaultdict(int)
+        vocab.index = len(words)
         print(vocab.index)
         return vocab
 
@@ -114,6 +151,296 @@ class Vocab():
         )
 
 
+MAGIC = b'VOCABv01'
+HEADER = struct.Struct('<8sQQQ')
+EMPTY = -1
+
+
+def _align(n):
+    return (n + 7) // 8 * 8
+
+
+def write_frozen(words, output_file):
+    '''
+    Write the binary format read by FrozenVocab. The words are given in
+    ID order, from any iterable: they are streamed to a side file, so
+    only their offsets and hashes are kept in memory. Layout:
+
+        header    magic, number of words, hash slots and string bytes
+        offsets   int64[n_words + 1], byte offsets into the strings
+        slots     int32[n_slots], open addressing table of word IDs
+                  keyed by the CRC32 of the word, EMPTY if unused
+        strings   UTF-8 words in ID order
+    '''
+    tmp_file = f'{output_file}.{os.getpid()}.tmp'
+    strings_file = tmp_file + '.strings'
+    offsets = array('q', [0])
+    hashes = array('I')
+    with open(strings_file, 'wb') as f:
+        for word in words:
+            e = word.encode('utf-8')
+            f.write(e)
+            offsets.append(offsets[-1] + len(e))
+            hashes.append(zlib.crc32(e))
+    n_words = len(hashes)
+    n_slots = 1
+    while n_slots < 2 * n_words:
+        n_slots *= 2
+    mask = n_slots - 1
+    slots = array('i', [EMPTY]) * n_slots
+    with open(strings_file, 'rb') as f:
+        # Strings are only read back for full CRC32 collisions
+        blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+            if offsets[-1] else b''
+        for i, crc in enumerate(hashes):
+            h = crc & mask
+            while slots[h] != EMPTY:
+                j = slots[h]
+                if hashes[j] == crc and \
+                   blob[offsets[j]:offsets[j + 1]] == blob[offsets[i]:offsets[i + 1]]:
+                    break
+                h = (h + 1) & mask
+            else:
+                slots[h] = i
+        with open(tmp_file, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, n_words, n_slots, offsets[-1]))
+            for arr in (offsets, slots):
+                data = arr.tobytes()
+                out.write(data)
+                out.write(b'\0' * (_align(len(data)) - len(data)))
+            f.seek(0)
+            shutil.copyfileobj(f, out)
+        if offsets[-1]:
+            blob.close()
+    os.remove(strings_file)
+    os.replace(tmp_file, output_file)
+
+
+class FrozenVocab:
+    '''
+    Read-only vocabulary backed by a memory-mapped file written by
+    write_frozen(). Opening it reads only the header, and processes
+    mapping the same file share its pages, so any number of workers
+    can use one vocabulary for the cost of one.
+
+    Lookups behave like Vocab.__getitem__: an unknown word or ID gives
+    the ID of the unknown label.
+    '''
+    def __init__(self, input_file, language=None):
+        self.input_file = input_file
+        self.language = language
+        with open(input_file, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_words, n_slots, n_bytes = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f'{input_file} is not a binary vocabulary.')
+        view = memoryview(self._mm)
+        start = HEADER.size
+        end = start + 8 * (n_words + 1)
+        self._offsets = view[start:end].cast('q')
+        start = _align(end)
+        end = start + 4 * n_slots
+        self._slots = view[start:end].cast('i')
+        start = _align(end)
+        self._strings = view[start:start + n_bytes]
+        self._mask = n_slots - 1
+        self.index = n_words
+        self.unk = self._find(unknown_label.encode('utf-8'))
+
+    def __getstate__(self):
+        return {'input_file': self.input_file, 'language': self.language}
+
+    def __setstate__(self, state):
+        self.__init__(state['input_file'], state['language'])
+
+    def _word(self, i):
+        return self._strings[self._offsets[i]:self._offsets[i + 1]]
+
+    def _find(self, e):
+        slots = self._slots
+        h = zlib.crc32(e) & self._mask
+        while True:
+            i = slots[h]
+            if i == EMPTY or self._word(i) == e:
+                return i
+            h = (h + 1) & self._mask
+
+    def get(self, word, default=None):
+        i = self._find(word.encode('utf-8'))
+        return default if i == EMPTY else i
+
+    def check_word(self, word):
+        return self._find(word.encode('utf-8')) != EMPTY
+
+    __contains__ = check_word
+
+    def __getitem__(self, key):
+        if type(key) == str:
+            i = self._find(key.encode('utf-8'))
+            return self.unk if i == EMPTY else i
+        try:
+            i = operator.index(key)
+        except TypeError:
+            return self.unk
+        if 0 <= i < self.index:
+            return bytes(self._word(i)).decode('utf-8')
+        return self.unk
+
+    def __len__(self):
+        return self.index
+
+    def __iter__(self):
+        for i in range(self.index):
+            yield self[i]
+
+    def save(self, output_file):
+        with open(output_file, 'w') as f:
+            for word in self:
+                print(word, file=f)
+
+
+def load_frozen(input_file, language=None):
+    '''
+    FrozenVocab of the text vocabulary `input_file`. The binary version
+    is kept next to it with a .bin suffix and rebuilt when the text
+    file is newer.
+    '''
+    bin_file = input_file + '.bin'
+    if (not os.path.isfile(bin_file)
+            or os.path.getmtime(bin_file) < os.path.getmtime(input_file)):
+        Vocab.load(input_file, language).save_binary(bin_file)
+    return FrozenVocab(bin_file, language)
+
+
+class DeltaVocab:
+    '''
+    Worker-local view of a shared, read-only base vocabulary (Vocab or
+    FrozenVocab). Words missing from the base get provisional IDs after
+    it and are kept, with the frequency counts of this worker, in a
+    delta that merge_deltas() folds into the real vocabulary. Unlike
+    the VocabManager proxy no call leaves the process.
+    '''
+    def __init__(self, base):
+        self.base = base
+        self.base_size = len(base)
+        self.unk = base[unknown_label]
+        self.ids = {}
+        self.words = []
+        self.word_freq = defaultdict(int)
+
+    def _lookup(self, word):
+        i = self.ids.get(word)
+        if i is None and self.base.check_word(word):
+            i = self.ids[word] = self.base[word]
+        return i
+
+    def add(self, word):
+        i = self._lookup(word)
+        if i is None:
+            i = self.ids[word] = self.base_size + len(self.words)
+            self.words.append(word)
+        self.word_freq[word] += 1
+        return i
+
+    def check_word(self, word):
+        return self._lookup(word) is not None
+
+    def __getitem__(self, key):
+        if type(key) == str:
+            i = self._lookup(key)
+            return self.unk if i is None else i
+        if key >= self.base_size:
+            try:
+                return self.words[key - self.base_size]
+            except IndexError:
+                return self.unk
+        return self.base[key]
+
+    def __len__(self):
+        return self.base_size + len(self.words)
+
+    @property
+    def index(self):
+        return len(self)
+
+    def delta(self):
+        '''
+        The new words in provisional ID order and the frequency counts
+        of this worker, for merge_deltas().
+        '''
+        return {
+            'base_size': self.base_size,
+            'words': self.words,
+            'freq': dict(self.word_freq)
+        }
+
+
+def merge_deltas(vocab, deltas):
+    '''
+    Add the words of DeltaVocab deltas to `vocab` in order, giving them
+    their final IDs, and sum up their frequencies. Returns for every
+    delta the list mapping its provisional IDs to final ones.
+    '''
+    remaps = []
+    for delta in deltas:
+        base_size = delta['base_size']
+        remap = list(range(base_size))
+        for word in delta['words']:
+            i = vocab.word2index.get(word)
+            if i is None:
+                i = vocab.index
+                vocab.word2index[word] = i
+                vocab.index2word[i] = word
+                vocab.index += 1
+                vocab.word_freq.setdefault(word, 0)
+            remap.append(i)
+        for word, f in delta['freq'].items():
+            vocab.word_freq[word] = vocab.word_freq.get(word, 0) + f
+        remaps.append(remap)
+    return remaps
+
+
+def prune_map(counts, min_count=1, coverage=None, max_size=None):
+    '''
+    Old ID -> new ID list for a vocabulary reduced to its frequent
+    words, `counts` being the corpus count of every ID. A word is kept
+    if it occurs at least `min_count` times, is among the `max_size`
+    most frequent words and among those covering the first `coverage`
+    share of all tokens. The special labels are always kept, the words
+    keep their relative order and dropped words map to unknown_label.
+    '''
+    n_special = len(special_labels)
+    ranked = sorted(
+        range(n_special, len(counts)),
+        key=lambda i: counts[i],
+        reverse=True
+    )
+    ranked = [i for i in ranked if counts[i] >= min_count]
+    if max_size is not None:
+        ranked = ranked[:max(max_size - n_special, 0)]
+    if coverage is not None:
+        total = sum(counts[n_special:])
+        covered = 0
+        for n, i in enumerate(ranked):
+            if covered >= coverage * total:
+                ranked = ranked[:n]
+                break
+            covered += counts[i]
+    keep = set(ranked)
+    unk = special_labels.index(unknown_label)
+    remap = []
+    new_id = n_special
+    for i in range(len(counts)):
+        if i < n_special:
+            remap.append(i)
+        elif i in keep:
+            remap.append(new_id)
+            new_id += 1
+        else:
+            remap.append(unk)
+    return remap
+
+
 class VocabManager(BaseManager):
     pass
 